@@ -0,0 +1,87 @@
+"""Compare ways of restoring encoded links on large outputs.
+
+Run with ``python -m benchmarks.links`` from the root of the repository.
+"""
+import argparse
+import re
+import timeit
+
+from pelican.plugins.pandoc_reader import (
+    ENCODED_LINKS_TO_RAW_LINKS_MAP,
+    PandocReader,
+)
+
+PARAGRAPH = (
+    '<p>Some text with a <a href="%7Bfilename%7D/posts/{0}.md">link</a>'
+    ' and an <img src="%7Bstatic%7D/images/{0}.png" alt="image" />'
+    " as well as plain prose that has no link in it at all.</p>\n"
+)
+PLAIN_PARAGRAPH = "<p>Plain prose without any links, repeated {0} times.</p>\n"
+LINKS_MAP = dict(ENCODED_LINKS_TO_RAW_LINKS_MAP)
+LINK_PATTERN = re.compile("|".join(map(re.escape, LINKS_MAP)))
+READER = PandocReader({})
+
+
+def restore_with_loop(output):
+    """Restore links the way the plugin used to, one entry at a time."""
+    for encoded_str, raw_str in ENCODED_LINKS_TO_RAW_LINKS_MAP.items():
+        output = output.replace(encoded_str, raw_str)
+    return output
+
+
+def restore_in_one_pass(output):
+    """Restore links with a single regular expression substitution."""
+    return LINK_PATTERN.sub(lambda match: LINKS_MAP[match.group(0)], output)
+
+
+def restore_links(output):
+    """Restore links the way the plugin does now."""
+    return READER._restore_links(output)
+
+
+def main():
+    """Time every approach on outputs with and without links."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--paragraphs",
+        type=int,
+        default=20000,
+        help="number of paragraphs in every output",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="conversions per timing"
+    )
+    args = parser.parse_args()
+
+    outputs = {
+        "with links": "".join(
+            PARAGRAPH.format(index) for index in range(args.paragraphs)
+        ),
+        "without links": "".join(
+            PLAIN_PARAGRAPH.format(index) for index in range(args.paragraphs)
+        ),
+    }
+    for name, output in outputs.items():
+        expected = restore_with_loop(output)
+        assert restore_in_one_pass(output) == expected
+        assert restore_links(output) == expected
+        print("{} ({:.1f} MB):".format(name, len(output) / 1e6))
+        for function in (
+            restore_with_loop,
+            restore_in_one_pass,
+            restore_links,
+        ):
+            seconds = min(
+                timeit.repeat(
+                    lambda: function(output), number=args.repeat, repeat=3
+                )
+            )
+            print(
+                "  {:<20} {:8.2f} ms".format(
+                    function.__name__, seconds / args.repeat * 1000
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Measure how fast PandocReader.read turns synthetic corpora into HTML.
+
+Every corpus is written to a temporary directory and read file by file
+with the render cache disabled, so that every read runs pandoc. Each
+corpus is measured in a process of its own, so that the peak memory of
+one corpus does not carry over to the next. Nothing is fetched from the
+network. Run with ``python -m benchmarks.reader``
+from the root of the repository, or with ``invoke benchmark``.
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from pelican.plugins.pandoc_reader import PandocReader
+from pelican.settings import DEFAULT_CONFIG
+
+HEADER = """---
+title: "Post {index}"
+author: "My Author"
+date: "2020-10-16"
+summary: "The *summary* of post {index}."
+---
+"""
+PARAGRAPH = """
+Lorem ipsum dolor sit amet, *consectetur* adipiscing elit, sed do eiusmod
+tempor incididunt ut labore et dolore magna aliqua. See [the
+documentation](https://example.com/docs/{index}) for more.
+"""
+MATH = """
+The energy is $E = mc^2$ and the sum is
+
+$$
+\\sum_{{i=1}}^{{n}} i = \\frac{{n(n+1)}}{{2}}, \\quad
+e^{{i\\theta}} = \\cos\\theta + i \\sin\\theta.
+$$
+"""
+SECTION = """
+## Section {index}
+
+### Subsection {index}.1
+"""
+CITATION = """
+As shown by [@reference{index}] and @reference{other}.
+"""
+FIELDS = {
+    "subtitle": "A 'smart' -- subtitle of post {index}",
+    "disclaimer": "Opinions are **my own**.",
+    "abstract": "An abstract with `code` and a [link](https://example.com).",
+    "note": "A note with a footnote.^[The footnote of post {index}.]",
+    "teaser": "<span>Raw HTML</span> in a teaser.",
+}
+BIB_ENTRY = """@article{{reference{index},
+  author = {{Author, Some and Writer, Other}},
+  title = {{The Title of Reference {index}}},
+  journal = {{Journal of Benchmarks}},
+  year = {{{year}}},
+  volume = {{{volume}}},
+  pages = {{1--10}},
+}}
+"""
+
+# Every corpus is a function returning the content of a document along
+# with the settings its documents are read with
+CORPORA = {}
+
+
+def corpus(function):
+    """Register a corpus under the name of its function."""
+    CORPORA[function.__name__] = function
+    return function
+
+
+@corpus
+def plain(index, paragraphs):
+    """Return a post consisting of plain paragraphs."""
+    body = "".join(PARAGRAPH.format(index=index) for _ in range(paragraphs))
+    return HEADER.format(index=index) + body, {}
+
+
+@corpus
+def math(index, paragraphs):
+    """Return a math heavy post like mathjax_content.md."""
+    body = "".join(
+        PARAGRAPH.format(index=index) + MATH for _ in range(paragraphs)
+    )
+    return HEADER.format(index=index) + body, {"PANDOC_ARGS": ["--mathjax"]}
+
+
+@corpus
+def toc(index, paragraphs):
+    """Return a post with many sections and a table of contents."""
+    body = "".join(
+        SECTION.format(index=section) + PARAGRAPH.format(index=index)
+        for section in range(paragraphs)
+    )
+    return HEADER.format(index=index) + body, {"PANDOC_ARGS": ["--toc"]}
+
+
+@corpus
+def citations(index, paragraphs):
+    """Return a post citing references from a large bibliography."""
+    body = "".join(
+        PARAGRAPH.format(index=index)
+        + CITATION.format(index=index * paragraphs + paragraph, other=index)
+        for paragraph in range(paragraphs)
+    )
+    return (
+        HEADER.format(index=index) + body,
+        {
+            "PANDOC_EXTENSIONS": ["+citations"],
+            "PANDOC_ARGS": ["--citeproc"],
+        },
+    )
+
+
+@corpus
+def fields(index, paragraphs):
+    """Return a post with many formatted fields."""
+    header = HEADER.format(index=index).rstrip("-\n") + "\n"
+    for key, value in FIELDS.items():
+        header += '{}: "{}"\n'.format(key, value.format(index=index))
+    body = "".join(PARAGRAPH.format(index=index) for _ in range(paragraphs))
+    return (
+        header + "---\n" + body,
+        {"FORMATTED_FIELDS": ["summary"] + list(FIELDS)},
+    )
+
+
+def write_corpus(directory, name, documents, paragraphs, references):
+    """Write the documents of a corpus and return their paths and settings."""
+    source_paths = []
+    settings = {}
+    for index in range(documents):
+        content, settings = CORPORA[name](index, paragraphs)
+        source_path = os.path.join(directory, "{}-{}.md".format(name, index))
+        with open(source_path, "w", encoding="utf-8") as file_handle:
+            file_handle.write(content)
+        source_paths.append(source_path)
+
+    # Bibliographies are found by the name of the document they belong to
+    if name == "citations":
+        bibliography = "".join(
+            BIB_ENTRY.format(
+                index=index, year=1950 + index % 70, volume=index % 40
+            )
+            for index in range(max(references, documents * paragraphs))
+        )
+        for source_path in source_paths:
+            bib_path = os.path.splitext(source_path)[0] + ".bib"
+            with open(bib_path, "w", encoding="utf-8") as file_handle:
+                file_handle.write(bibliography)
+    return source_paths, settings
+
+
+def create_settings(directory, corpus_settings, args):
+    """Return Pelican settings for reading a corpus in directory."""
+    settings = copy.deepcopy(DEFAULT_CONFIG)
+    settings.update(
+        PATH=directory,
+        PANDOC_PREPARSE_BIBLIOGRAPHY=args.preparse_bibliographies,
+        CALCULATE_READING_TIME=True,
+        FORMATTED_FIELDS=["summary"],
+    )
+    settings.update(corpus_settings)
+    return settings
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of values lie."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(source_paths, settings):
+    """Read every document and return the measurements of the corpus.
+
+    Memory is traced in a second pass, as tracing slows Python down. The
+    peak resident memory of pandoc is that of the largest pandoc process
+    run by the current process, which is expected to measure a single
+    corpus.
+    """
+    reader = PandocReader(settings)
+    latencies = []
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with mock.patch.object(
+        PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+    ) as run_pandoc:
+        start = time.perf_counter()
+        for source_path in source_paths:
+            document_start = time.perf_counter()
+            reader.read(source_path)
+            latencies.append(time.perf_counter() - document_start)
+        seconds = time.perf_counter() - start
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    tracemalloc.start()
+    for source_path in source_paths:
+        reader.read(source_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "documents": len(source_paths),
+        "seconds": seconds,
+        "documents_per_second": len(source_paths) / seconds,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+        },
+        "pandoc_runs": run_pandoc.call_count,
+        "pandoc_cpu_seconds": (
+            children_after.ru_utime
+            + children_after.ru_stime
+            - children_before.ru_utime
+            - children_before.ru_stime
+        ),
+        "python_peak_mb": peak / 1e6,
+        "pandoc_peak_rss_mb": children_after.ru_maxrss / 1e3,
+    }
+
+
+def measure_corpus(name, args):
+    """Write a corpus to a temporary directory and measure reading it."""
+    with tempfile.TemporaryDirectory() as directory:
+        source_paths, corpus_settings = write_corpus(
+            directory,
+            name,
+            args.documents,
+            args.paragraphs,
+            args.references,
+        )
+        settings = create_settings(directory, corpus_settings, args)
+        return measure(source_paths, settings)
+
+
+def main():
+    """Measure every requested corpus and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        choices=sorted(CORPORA),
+        help="corpus to measure, may be repeated, defaults to all",
+    )
+    parser.add_argument(
+        "--documents", type=int, default=20, help="documents per corpus"
+    )
+    parser.add_argument(
+        "--paragraphs",
+        type=int,
+        default=20,
+        help="paragraphs, sections or citations per document",
+    )
+    parser.add_argument(
+        "--references",
+        type=int,
+        default=2000,
+        help="references in the bibliography of the citations corpus",
+    )
+    parser.add_argument(
+        "--preparse-bibliographies",
+        action="store_true",
+        help="enable PANDOC_PREPARSE_BIBLIOGRAPHY",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # The peak resident memory of child processes is only known for all
+    # children of a process together, so every corpus gets a fresh process
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in args.corpus or sorted(CORPORA):
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(measure_corpus, (name, args))
+
+    print(
+        "{:<10} {:>8} {:>8} {:>8} {:>8} {:>6} {:>9} {:>9}".format(
+            "corpus",
+            "docs/s",
+            "p50 ms",
+            "p90 ms",
+            "p99 ms",
+            "runs",
+            "py MB",
+            "pandoc MB",
+        )
+    )
+    for name, result in results.items():
+        print(
+            "{:<10} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:6} {:9.2f} {:9.1f}".format(
+                name,
+                result["documents_per_second"],
+                result["latency_ms"]["p50"],
+                result["latency_ms"]["p90"],
+                result["latency_ms"]["p99"],
+                result["pandoc_runs"],
+                result["python_peak_mb"],
+                result["pandoc_peak_rss_mb"],
+            )
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file_handle:
+            json.dump(results, file_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare the word counters used to calculate reading time.
+
+Run with ``python -m benchmarks.word_count`` from the root of the
+repository.
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from mwc.counter import count_words_in_markdown
+from pelican.plugins.pandoc_reader import count_words
+
+HEADER = '---\ntitle: "A Large Document"\nauthor: "My Author"\n---\n'
+SECTION = """
+## Section {0}
+
+Lorem ipsum dolor sit amet, *consectetur* adipiscing elit, sed do eiusmod
+tempor incididunt ut labore et dolore magna aliqua. See [the
+documentation](https://example.com/docs/{0}) and the figure below.
+
+![A figure](images/figure-{0}.png)
+
+```python
+def section_{0}(values):
+    return sum(value * value for value in values)
+```
+
+The energy is $E = mc^2$ and the sum is
+
+$$
+\\sum_{{i=1}}^{{n}} i = \\frac{{n(n+1)}}{{2}}
+$$
+
+<div class="note">Raw HTML with <em>some</em> words in it.</div>
+"""
+
+
+def main():
+    """Time both counters and trace their memory on a large document."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sections",
+        type=int,
+        default=5000,
+        help="number of sections in the document",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="counts per timing"
+    )
+    args = parser.parse_args()
+
+    content = HEADER + "".join(
+        SECTION.format(index) for index in range(args.sections)
+    )
+    print("Document of {:.1f} MB:".format(len(content) / 1e6))
+    for function in (count_words_in_markdown, count_words):
+        seconds = min(
+            timeit.repeat(
+                lambda: function(content), number=args.repeat, repeat=3
+            )
+        )
+        tracemalloc.start()
+        words = function(content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            "  {:<25} {:8.2f} ms {:8.2f} MB peak {:>9} words".format(
+                function.__name__,
+                seconds / args.repeat * 1000,
+                peak / 1e6,
+                words,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+-- Convert a batch of documents, each given as the text of a code block,
+-- in a single pandoc run. Every document is read and written on its own in
+-- the formats given by its attributes, so heading identifiers, footnotes
+-- and reference links cannot leak from one document into another. The
+-- outputs are returned as a single raw HTML block, which the HTML writer
+-- passes on as it is, preceded, separated and followed by the separator
+-- of the batch. Documents that cannot be converted are replaced by the
+-- failure marker of the batch, leaving it to the reader to convert them
+-- on their own.
+local function convert(block, meta)
+  local doc = pandoc.read(
+    block.text, block.attributes.from, PANDOC_READER_OPTIONS
+  )
+  -- Metadata given on the command line overrides that of the document
+  for key, value in pairs(meta) do
+    doc.meta[key] = value
+  end
+  return pandoc.write(doc, block.attributes.to, PANDOC_WRITER_OPTIONS)
+end
+
+function Pandoc(batch)
+  local outputs = {}
+  local separator = ""
+  for _, block in ipairs(batch.blocks) do
+    separator = block.attributes.separator
+    local converted, output = pcall(convert, block, batch.meta)
+    if not converted then
+      output = block.attributes.failure
+    end
+    outputs[#outputs + 1] = output
+  end
+  return pandoc.Pandoc({
+    pandoc.RawBlock(
+      "html", separator .. table.concat(outputs, separator) .. separator
+    ),
+  })
+end
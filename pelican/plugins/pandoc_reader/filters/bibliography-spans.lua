@@ -0,0 +1,14 @@
+-- Keep spans without attributes when writing a bibliography as Markdown.
+-- Bare braces in BibTeX fields become such spans, which the Markdown writer
+-- would otherwise drop. Written as raw HTML, they are read back unchanged.
+function Span(span)
+  if span.identifier ~= "" or #span.classes > 0 or #span.attributes > 0 then
+    return nil
+  end
+  local inlines = {pandoc.RawInline("html", "<span>")}
+  for _, inline in ipairs(span.content) do
+    table.insert(inlines, inline)
+  end
+  table.insert(inlines, pandoc.RawInline("html", "</span>"))
+  return inlines
+end
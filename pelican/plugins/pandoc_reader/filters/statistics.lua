@@ -0,0 +1,51 @@
+-- Count the words, images, code blocks and headings of a document.
+-- The counts are appended to the body in an HTML comment, which the reader
+-- removes from the output again. Words in image descriptions and in the
+-- list of references are not counted, neither is code or math.
+local MARKER = "pandoc-reader-statistics"
+
+-- Dashes, ellipses and quotes pandoc uses for smart punctuation
+local PUNCTUATION = { "–", "—", "…", "‘", "’", "“", "”" }
+
+local function is_word(text)
+  for _, mark in ipairs(PUNCTUATION) do
+    text = text:gsub(mark, "")
+  end
+  return text:find("[%w\128-\255]") ~= nil
+end
+
+function Pandoc(doc)
+  local images = 0
+  local prose = pandoc.walk_block(pandoc.Div(doc.blocks), {
+    Image = function()
+      images = images + 1
+      return pandoc.Str("")
+    end,
+    Div = function(div)
+      if div.identifier == "refs" then
+        return {}
+      end
+    end,
+  })
+
+  local words, code_blocks, headings = 0, 0, 0
+  pandoc.walk_block(prose, {
+    Str = function(str)
+      -- Punctuation on its own, such as a dash, is not a word
+      if is_word(str.text) then
+        words = words + 1
+      end
+    end,
+    CodeBlock = function()
+      code_blocks = code_blocks + 1
+    end,
+    Header = function()
+      headings = headings + 1
+    end,
+  })
+
+  doc.blocks:insert(pandoc.RawBlock("html", string.format(
+    "<!-- %s %d %d %d %d -->", MARKER, words, images, code_blocks, headings
+  )))
+  return doc
+end
@@ -1,20 +1,59 @@
 """Reader that processes Pandoc Markdown and returns HTML 5."""
+import asyncio
+import base64
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import contextlib
+import contextvars
+import fnmatch
+import hashlib
+import http.client
+import json
+import logging
 import math
 import os
+import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+import weakref
+import zlib
 
-from yaml import safe_load
+from yaml import BaseLoader, YAMLError, load_all, safe_dump, safe_load
 
 from mwc.counter import count_words_in_markdown
 from pelican import signals
 from pelican.readers import BaseReader
 from pelican.utils import pelican_open
 
+logger = logging.getLogger(__name__)
+
 DIR_PATH = os.path.dirname(__file__)
 TEMPLATES_PATH = os.path.abspath(os.path.join(DIR_PATH, "templates"))
-TOC_TEMPLATE = "toc-template.html"
+FILTERS_PATH = os.path.abspath(os.path.join(DIR_PATH, "filters"))
+TOC_TEMPLATE = "toc-body-template.html"
+TOC_TEMPLATE_PATH = os.path.join(TEMPLATES_PATH, TOC_TEMPLATE)
+TOC_BODY_SEPARATOR = "<!-- pandoc-reader-body -->\n"
 DEFAULT_READING_SPEED = 200  # Words per minute
+WORD_COUNT_METHODS = ("mwc", "native", "pandoc")
+STATISTICS = ("words", "images", "code_blocks", "headings")
+STATISTICS_MARKER = "<!-- pandoc-reader-statistics "
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024  # Bytes
+DEFAULT_PROFILE_TOP = 10  # Slowest files listed in the build profile
+DEFAULT_BATCH_SIZE = 1  # Files rendered together by a background worker
+MAX_BATCH_BYTES = 256 * 1024  # Larger files are rendered on their own
+CACHE_FORMAT_VERSION = 3
+MANIFEST_FILE = "manifest"
+BIBLIOGRAPHIES_DIRECTORY = "bibliographies"
+FIELD_MEMO_FILE = "fields"
+DEFAULT_SERVER_URL = "http://localhost:3030"
+SERVER_TIMEOUT = 60  # Seconds
+SERVER_RETRY_INTERVAL = 60  # Seconds
 
 ENCODED_LINKS_TO_RAW_LINKS_MAP = {
     "%7Bstatic%7D": "{static}",
@@ -22,11 +61,153 @@ ENCODED_LINKS_TO_RAW_LINKS_MAP = {
     "%7Bfilename%7D": "{filename}",
 }
 
+# Formatted fields are converted in a single pandoc run by placing this
+# token between them as a paragraph of its own
+SEGMENT_SEPARATOR = "PANDOCREADERSEGMENTSEPARATOR"
+
+LINE_BREAK = re.compile(
+    "\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]"
+)  # Line boundaries recognized by str.splitlines
+FRONT_MATTER_DELIMITERS = ("---", "...")
+
+WORD_COUNT_TOKENS = re.compile(
+    r"""
+    (?P<words>\w[^\s`<$!\[\]]*(?:[ ]\w[^\s`<$!\[\]]*)*)  # Single spaced words
+    |(?P<fence>^[ ]{0,3}(?P<marker>`{3,}|~{3,}).*?
+        (?:^[ ]{0,3}(?P=marker)[`~]*[ \t]*$|\Z))  # Fenced code
+    |(?P<comment><!--.*?(?:-->|\Z))  # HTML comments
+    |(?P<tag></?[A-Za-z][^>]*>)  # Raw HTML tags
+    |(?P<math>\$\$.*?(?:\$\$|\Z)|\$[^$\s](?:[^$\n]*[^$\s])?\$)  # Math
+    |(?P<image>!\[[^\]]*\]\([^)]*\))  # Images
+    |(?P<target>\]\([^)]*\))  # Link targets
+    |(?P<code>`[^`\n]*`)  # Inline code
+    """,  # None of the skipped spans starts with a word character
+    re.MULTILINE | re.DOTALL | re.VERBOSE,
+)
+
+# Values containing any of these may affect how neighbouring values are
+# rendered, e.g. through footnote numbering, citations, reference links or
+# unclosed blocks, so they are always converted on their own
+ISOLATED_SEGMENT_MARKERS = (
+    "^[",
+    "[^",
+    "@",
+    "]:",
+    "<",
+    "```",
+    "~~~",
+    ":::",
+)
+
+# Block level elements that must be closed within the output of a segment
+SEGMENT_BLOCK_TAGS = re.compile(
+    r"<(/?)(div|section|blockquote|ul|ol|li|dl|table|figure|pre)\b"
+)
+
+CITATION_KEY = re.compile(r"@(?:\{([^}]*)\}|(\w[\w:.#$%&\-+?<>~/]*))")
+CITATION_KEY_PUNCTUATION = ":.#$%&-+?<>~/"
+
 VALID_INPUT_FORMATS = ("markdown", "commonmark", "gfm")
 VALID_OUTPUT_FORMATS = ("html", "html5")
 UNSUPPORTED_ARGUMENTS = ("--standalone", "--self-contained")
 VALID_BIB_EXTENSIONS = ["json", "yaml", "bibtex", "bib"]
+BIB_INPUT_FORMATS = {".bib": "biblatex", ".bibtex": "bibtex"}
+BIB_SPANS_FILTER = "bibliography-spans.lua"
+STATISTICS_FILTER = "statistics.lua"
+BATCH_FILTER = "batch.lua"
+PLUGIN_FILES = [
+    TOC_TEMPLATE_PATH,
+    os.path.join(FILTERS_PATH, BIB_SPANS_FILTER),
+    os.path.join(FILTERS_PATH, STATISTICS_FILTER),
+    os.path.join(FILTERS_PATH, BATCH_FILTER),
+]  # Read by pandoc, so changes to them must invalidate the cache
 FILE_EXTENSIONS = ["md", "markdown", "mkd", "mdown"]
+VALID_BACKENDS = ("subprocess", "server")
+
+# Options that apply to every document of a batch when passed along to the
+# batch filter, others either transform the input as a whole or read files
+# specific to a document. The table of contents template comes with the
+# standalone option.
+BATCH_OPTIONS = (
+    "--tab-stop",
+    "--preserve-tabs",
+    "-p",
+    "--indented-code-classes",
+    "--default-image-extension",
+    "--metadata",
+    "-M",
+    "--strip-comments",
+    "--abbreviations",
+    "--file-scope",
+    "--toc",
+    "--table-of-contents",
+    "--toc-depth",
+    "--number-sections",
+    "-N",
+    "--number-offset",
+    "--section-divs",
+    "--id-prefix",
+    "--wrap",
+    "--columns",
+    "--email-obfuscation",
+    "--html-q-tags",
+    "--ascii",
+    "--reference-location",
+    "--top-level-division",
+    "--mathjax",
+    "--katex",
+    "--mathml",
+    "--webtex",
+    "--gladtex",
+    "--no-highlight",
+    "--highlight-style",
+    "--syntax-highlighting",
+    "--syntax-definition",
+    "--variable",
+    "-V",
+    "--standalone",
+    "--template",
+)
+BATCH_SEPARATOR = "<!-- pandoc-reader-batch {} -->"
+BATCH_PANDOC_VERSION = (2, 17)  # First to give reader options to filters
+BATCH_FAILURE = "<!-- pandoc-reader-batch-failure {} -->"
+
+# Command line options and defaults file keys whose values are files read
+# by pandoc, which therefore influence the rendered output
+FILE_OPTIONS = (
+    "--defaults",
+    "-d",
+    "--lua-filter",
+    "-L",
+    "--filter",
+    "-F",
+    "--csl",
+    "--bibliography",
+    "--template",
+    "--metadata-file",
+    "--include-in-header",
+    "-H",
+    "--include-before-body",
+    "-B",
+    "--include-after-body",
+    "-A",
+    "--abbreviations",
+    "--syntax-definition",
+)
+DEFAULTS_FILE_KEYS = (
+    "filters",
+    "csl",
+    "bibliography",
+    "template",
+    "metadata-file",
+    "metadata-files",
+    "include-in-header",
+    "include-before-body",
+    "include-after-body",
+    "abbreviations",
+    "syntax-definition",
+    "syntax-definitions",
+)
 
 
 class PandocReader(BaseReader):
@@ -38,21 +219,291 @@ class PandocReader(BaseReader):
     def read(self, source_path):
         """Parse Pandoc Markdown and return HTML5 markup and metadata."""
         # Check if pandoc is installed and is executable
-        if not shutil.which("pandoc"):
+        if not get_pandoc_path(self.settings):
             raise Exception("Could not find Pandoc. Please install.")
 
-        # Open markdown file and read content
-        content = ""
-        with pelican_open(source_path) as file_content:
-            content = file_content
+        with profile_document(self.settings, source_path):
+            # Files unchanged since they were last rendered while watching
+            # are not even read again
+            rendered = self._get_watched(source_path)
+            if rendered is not None:
+                return self._create_output(rendered)
+
+            # Collect the result if the file has been rendered in the
+            # background
+            prerender_pool = get_prerender_pool(self.settings)
+            if prerender_pool is not None:
+                rendered = prerender_pool.collect(source_path)
+                if rendered is not None:
+                    return self._create_output(rendered)
 
-        # Retrieve HTML content and metadata
-        output, metadata = self._create_html(source_path, content)
+            # Open markdown file and read content
+            signature = get_file_signature(source_path)
+            content = self._read_source(source_path)
+
+            # Retrieve HTML content and metadata
+            output, metadata = self._create_html(
+                source_path, content, signature
+            )
 
         return output, metadata
 
-    def _create_html(self, source_path, content):
+    async def read_async(self, source_path):
+        """Parse Pandoc Markdown without blocking the running event loop.
+
+        Return the same HTML5 markup and metadata as read does. Pandoc is
+        run in asyncio subprocesses, converting the content and formatted
+        fields of a file at the same time.
+        """
+        # Check if pandoc is installed and is executable
+        if not get_pandoc_path(self.settings):
+            raise Exception("Could not find Pandoc. Please install.")
+
+        with profile_document(self.settings, source_path):
+            rendered = self._get_watched(source_path)
+            if rendered is not None:
+                return self._create_output(rendered)
+
+            # Open markdown file and read content
+            signature = get_file_signature(source_path)
+            content = self._read_source(source_path)
+
+            rendered = await self._run_steps_async(
+                self._render_source_steps(source_path, content, signature)
+            )
+        return self._create_output(rendered)
+
+    @staticmethod
+    def _read_source(source_path):
+        """Return the content of a source file."""
+        with profile_phase("read"):
+            with pelican_open(source_path) as content:
+                return content
+
+    def read_lazy(self, source_path):
+        """Return HTML content that is only rendered once it is used.
+
+        The metadata is read right away like read_metadata does with
+        formatted fields, the content and the table of contents are lazy
+        stand-ins for strings that share a single rendering of the file.
+        """
+        # Check if pandoc is installed and is executable
+        if not get_pandoc_path(self.settings):
+            raise Exception("Could not find Pandoc. Please install.")
+
+        metadata = self.read_metadata(source_path, formatted_fields=True)
+        rendering = LazyRendering(self, source_path)
+        if self._get_pandoc_config()["table_of_contents"]:
+            metadata["toc"] = LazyContent(rendering, "toc")
+        return LazyContent(rendering, "output"), metadata
+
+    def read_metadata(self, source_path, formatted_fields=False):
+        """Return the metadata of a file without rendering its content.
+
+        The values of FORMATTED_FIELDS are returned as they are written
+        unless formatted_fields is set, in which case only these values
+        are converted by pandoc. The table of contents requires rendering
+        the content and is left out. The file is read only up to the end
+        of its header unless the reading time has to be calculated.
+        """
+        reading_time = None
+        statistics = None
+        if self.settings.get("CALCULATE_READING_TIME", []):
+            with pelican_open(source_path) as content:
+                header_lines, _ = scan_front_matter(content)
+                # Counting words with pandoc requires a conversion
+                if self._get_word_count_method() == "pandoc":
+                    statistics = self._count_with_pandoc(source_path, content)
+                reading_time = self._calculate_reading_time(
+                    content, statistics
+                )
+        else:
+            header_lines, _ = read_front_matter(source_path)
+        fields = self._parse_header_lines(header_lines)
+
+        if formatted_fields:
+            # Check if pandoc is installed and is executable
+            if not get_pandoc_path(self.settings):
+                raise Exception("Could not find Pandoc. Please install.")
+
+            config = self._get_pandoc_config()
+            pandoc_cmd = list(config["pandoc_cmd"])
+            if config["citations"]:
+                for bib_file in self._find_bibs(source_path):
+                    pandoc_cmd.append("--bibliography={0}".format(bib_file))
+            fields.update(self._convert_formatted_fields(pandoc_cmd, fields))
+        _, metadata = self._create_output(
+            RenderedDocument(
+                None,
+                reading_time=reading_time,
+                fields=fields,
+                statistics=statistics,
+            )
+        )
+        return metadata
+
+    def _count_with_pandoc(self, source_path, content):
+        """Return the statistics pandoc collects when converting content."""
+        # Check if pandoc is installed and is executable
+        if not get_pandoc_path(self.settings):
+            raise Exception("Could not find Pandoc. Please install.")
+
+        config = self._get_pandoc_config()
+        pandoc_cmd = list(config["pandoc_cmd"]) + self._get_statistics_args()
+        if config["citations"]:
+            for bib_file in self._find_bibs(source_path):
+                pandoc_cmd.append("--bibliography={0}".format(bib_file))
+        _, statistics = self._split_statistics(
+            self._convert(pandoc_cmd, content, "statistics")
+        )
+        return statistics
+
+    def _create_html(self, source_path, content, signature):
         """Create HTML5 content."""
+        rendered = self._render_source(source_path, content, signature)
+        return self._create_output(rendered)
+
+    def _render_source(self, source_path, content, signature):
+        """Render content without processing the resulting metadata."""
+        return self._run_steps(
+            self._render_source_steps(source_path, content, signature)
+        )
+
+    def _render_source_steps(self, source_path, content, signature):
+        """Render content, yielding the conversions needed on a cache miss.
+
+        Signature is that of the source file taken before its content was
+        read, so that a file saved while it is being rendered is rendered
+        again the next time it is read.
+        """
+        with profile_phase("validation"):
+            config = self._get_pandoc_config()
+        pandoc_cmd = list(config["pandoc_cmd"])
+
+        # Find bibliography if citations are specified
+        bib_files = []
+        if config["citations"]:
+            with profile_phase("bibliography"):
+                bib_files = self._find_bibs(source_path)
+
+        # Reuse a previous rendering of identical input if one is cached
+        cache = get_render_cache(self.settings)
+        watch_cache = get_watch_cache(self.settings)
+        cache_key = None
+        rendered = None
+        if cache is not None or watch_cache is not None:
+            # Files the command refers to by path have to be part of the key,
+            # if any of them cannot be found the result is not cached
+            with profile_phase("cache"):
+                dependencies = self._hash_dependencies(config, bib_files)
+                if dependencies is None:
+                    cache = None
+                    watch_cache = None
+                else:
+                    settings_digest = self._create_settings_digest(config)
+                if cache is not None:
+                    cache_key = self._create_cache_key(
+                        content, settings_digest, dependencies
+                    )
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        rendered = RenderedDocument.from_dict(
+                            cached, self._get_compress()
+                        )
+
+        if rendered is None:
+            if self.settings.get("PANDOC_PREPARSE_BIBLIOGRAPHY", False):
+                with profile_phase("bibliography"):
+                    bib_files = self._prepare_bibliographies(
+                        bib_files, content, pandoc_cmd[0], config["nocite"]
+                    )
+            for bib_file in bib_files:
+                pandoc_cmd.append("--bibliography={0}".format(bib_file))
+            rendered = yield from self._render_steps(
+                content, pandoc_cmd, config["table_of_contents"]
+            )
+            if cache is not None:
+                cache.set(cache_key, rendered.to_dict())
+
+        if cache is not None:
+            get_build_manifest(self.settings).record(
+                source_path,
+                signature,
+                settings_digest,
+                dependencies,
+                cache_key,
+            )
+        if watch_cache is not None and signature is not None:
+            watch_cache.record(
+                source_path, signature, settings_digest, dependencies, rendered
+            )
+        return rendered
+
+    def _is_rendered(self, source_path):
+        """Check if the cached rendering of a file is still up to date.
+
+        The build manifest tells which inputs the file was last rendered
+        from, so this does not require reading the file itself.
+        """
+        if self._get_watched(source_path) is not None:
+            return True
+        cache = get_render_cache(self.settings)
+        if cache is None:
+            return False
+        entry = get_build_manifest(self.settings).get(source_path)
+        if entry is None:
+            return False
+
+        inputs = self._get_render_inputs(source_path)
+        if inputs is None:
+            return False
+        settings_digest, dependencies = inputs
+        return (
+            entry["signature"] == list(get_file_signature(source_path) or [])
+            and entry["settings"] == settings_digest
+            and entry["dependencies"] == dependencies
+            and cache.contains(entry["key"])
+        )
+
+    def _get_watched(self, source_path):
+        """Return the rendering of a file kept in memory while watching.
+
+        Return None unless PANDOC_WATCH is enabled and neither the file
+        nor any of its inputs changed since it was last rendered.
+        """
+        watch_cache = get_watch_cache(self.settings)
+        if watch_cache is None:
+            return None
+        with profile_phase("watch"):
+            inputs = self._get_render_inputs(source_path)
+            if inputs is None:
+                return None
+            return watch_cache.get(source_path, *inputs)
+
+    def _get_render_inputs(self, source_path):
+        """Return the settings digest and dependencies of rendering a file.
+
+        Return None if the configuration is invalid, which is reported once
+        the file is read.
+        """
+        try:
+            config = self._get_pandoc_config()
+            settings_digest = self._create_settings_digest(config)
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return None
+        bib_files = []
+        if config["citations"]:
+            bib_files = self._find_bibs(source_path)
+        return settings_digest, self._hash_dependencies(config, bib_files)
+
+    def _get_pandoc_config(self):
+        """Return the validated pandoc configuration of the settings.
+
+        Validating the configuration parses every default file, so the
+        result is kept until the settings, the default files or any other
+        file pandoc reads change, as these may use nocite. Invalid
+        configurations are not kept and raise on every call.
+        """
         # Get settings set in pelicanconf.py
         default_files = self.settings.get("PANDOC_DEFAULT_FILES", [])
         arguments = self.settings.get("PANDOC_ARGS", [])
@@ -61,6 +512,20 @@ class PandocReader(BaseReader):
         if isinstance(extensions, list):
             extensions = "".join(extensions)
 
+        pandoc_path = get_pandoc_path(self.settings) or "pandoc"
+        settings_key = json.dumps(
+            [pandoc_path, default_files, arguments, extensions]
+        )
+        signature = [get_file_signature(path) for path in default_files]
+        with _PANDOC_CONFIGS_LOCK:
+            config_signature, config = _PANDOC_CONFIGS.get(
+                settings_key, (None, None)
+            )
+        if config is not None and config_signature == (
+            signature + self._get_dependency_signature(config["dependencies"])
+        ):
+            return config
+
         # Check validity of arguments or default files
         table_of_contents, citations = self._validate_fields(
             default_files, arguments, extensions
@@ -68,42 +533,528 @@ class PandocReader(BaseReader):
 
         # Construct preliminary pandoc command
         pandoc_cmd = self._construct_pandoc_command(
-            default_files, arguments, extensions
+            default_files, arguments, extensions, pandoc_path
         )
 
-        # Find and add bibliography if citations are specified
-        if citations:
-            for bib_file in self._find_bibs(source_path):
-                pandoc_cmd.append("--bibliography={0}".format(bib_file))
+        dependencies = self._find_file_dependencies(pandoc_cmd)
+        signature += self._get_dependency_signature(dependencies)
+        config = {
+            "table_of_contents": table_of_contents,
+            "citations": citations,
+            "citeproc": self._check_if_citeproc(pandoc_cmd),
+            "nocite": self._check_if_nocite(pandoc_cmd, dependencies),
+            "pandoc_cmd": tuple(pandoc_cmd),
+            "dependencies": dependencies,
+        }
+        with _PANDOC_CONFIGS_LOCK:
+            _PANDOC_CONFIGS[settings_key] = (signature, config)
+        return config
 
-        # Create HTML content
-        output = self._run_pandoc(pandoc_cmd, content)
+    def _prepare_bibliographies(self, bib_files, content, pandoc_path, nocite):
+        """Return pre-parsed bibliographies holding only cited references.
 
-        # Replace all occurrences of %7Bstatic%7D to {static},
-        # %7Battach%7D to {attach} and %7Bfilename%7D to {filename}
-        # so that static links are resolvable by pelican
-        for encoded_str, raw_str in ENCODED_LINKS_TO_RAW_LINKS_MAP.items():
-            output = output.replace(encoded_str, raw_str)
+        Bibliographies that cannot be parsed are returned unchanged. No
+        reference is left out if the document or the configuration may cite
+        references without mentioning their keys.
+        """
+        cited_keys = None
+        if not nocite and "@*" not in content and "nocite" not in content:
+            cited_keys = self._find_citation_keys(content)
 
-        metadata = {}
-        if table_of_contents:
-            # Create table of contents and add to metadata
-            metadata["toc"] = self.process_metadata(
-                "toc", self._create_toc(pandoc_cmd, content)
+        bibliographies = []
+        for bib_file in bib_files:
+            references = self._load_references(bib_file, pandoc_path)
+            if references is None:
+                bibliographies.append(bib_file)
+                continue
+            if cited_keys is not None:
+                references = [
+                    reference
+                    for reference in references
+                    if reference.get("id") in cited_keys
+                ]
+            try:
+                bibliographies.append(
+                    write_bibliography(
+                        self.settings, references, bib_file.endswith(".json")
+                    )
+                )
+            except OSError as error:
+                logger.warning(
+                    "Could not write bibliography for %s: %s", bib_file, error
+                )
+                bibliographies.append(bib_file)
+        return bibliographies
+
+    def _load_references(self, bib_file, pandoc_path):
+        """Return the CSL references of a bibliography or None.
+
+        BibLaTeX and BibTeX files are converted by pandoc into CSL YAML,
+        which unlike CSL JSON keeps the markup of the fields. Every file is
+        parsed only once, the references are kept in memory and in the
+        render cache under the hash of its contents.
+        """
+        extension = os.path.splitext(bib_file)[1]
+        try:
+            with open(bib_file, "rb") as file_handle:
+                data = file_handle.read()
+        except OSError:
+            return None
+
+        digest = hashlib.sha256(extension.encode("utf-8") + b"\0" + data)
+        if extension in BIB_INPUT_FORMATS:
+            digest.update(repr(get_pandoc_version(pandoc_path)).encode())
+        key = "references-{}".format(digest.hexdigest())
+        with _REFERENCES_LOCK:
+            references = _REFERENCES.get(key)
+        if references is not None:
+            return references
+
+        cache = get_render_cache(self.settings)
+        if cache is not None:
+            references = cache.get(key)
+        if not isinstance(references, list):
+            try:
+                references = self._parse_references(
+                    data.decode("utf-8"), extension, pandoc_path
+                )
+            except (
+                subprocess.CalledProcessError,
+                ValueError,
+                YAMLError,
+            ) as error:
+                logger.warning(
+                    "Could not pre-parse bibliography %s: %s", bib_file, error
+                )
+                return None
+            if references is None:
+                return None
+            if cache is not None:
+                cache.set(key, references)
+
+        with _REFERENCES_LOCK:
+            _REFERENCES[key] = references
+        return references
+
+    def _parse_references(self, bibliography, extension, pandoc_path):
+        """Parse a bibliography into a list of CSL references or None."""
+        if extension == ".json":
+            references = json.loads(bibliography)
+            if not isinstance(references, list):
+                return None
+            return references
+
+        if extension in BIB_INPUT_FORMATS:
+            bibliography = self._convert(
+                [
+                    pandoc_path,
+                    "--from={}".format(BIB_INPUT_FORMATS[extension]),
+                    "--to=markdown-raw_attribute",
+                    "--standalone",
+                    "--lua-filter={}".format(
+                        os.path.join(FILTERS_PATH, BIB_SPANS_FILTER)
+                    ),
+                ],
+                bibliography,
+                "bibliography",
             )
 
-        if self.settings.get("CALCULATE_READING_TIME", []):
-            # Calculate reading time and add to metadata
+        # Scalars are loaded as strings so that they are written back as
+        # they were and pandoc reads them as markdown like it would have
+        for document in load_all(bibliography, Loader=BaseLoader):
+            if isinstance(document, dict):
+                references = document.get("references")
+                if isinstance(references, list) and all(
+                    isinstance(reference, dict) for reference in references
+                ):
+                    return references
+        return None
+
+    def _create_output(self, rendered):
+        """Return the HTML content and processed metadata of a rendering."""
+        metadata = {}
+        if rendered.toc is not None:
+            # Add table of contents to metadata
+            metadata["toc"] = self.process_metadata("toc", rendered.toc)
+
+        if rendered.reading_time is not None:
+            # Add reading time to metadata
             metadata["reading_time"] = self.process_metadata(
-                "reading_time", self._calculate_reading_time(content)
+                "reading_time", rendered.reading_time
+            )
+
+        for key, value in rendered.fields.items():
+            metadata[key] = self.process_metadata(key, value)
+
+        if rendered.statistics is not None:
+            metadata["statistics"] = self.process_metadata(
+                "statistics", rendered.statistics
             )
 
+        return rendered.output, metadata
+
+    def _get_compress(self):
+        """Check if rendered output is to be kept compressed in memory."""
+        return bool(self.settings.get("PANDOC_COMPRESS_OUTPUT", False))
+
+    def _run_steps(self, steps):
+        """Carry out the conversions of rendering steps one at a time.
+
+        Steps are generators yielding lists of pandoc commands along with
+        the text to convert and a label naming the conversion, which are
+        sent the list of outputs in return until they return their result.
+        """
+        try:
+            conversions = next(steps)
+            while True:
+                conversions = steps.send(
+                    [
+                        self._convert(pandoc_cmd, text, label)
+                        for pandoc_cmd, text, label in conversions
+                    ]
+                )
+        except StopIteration as finished:
+            return finished.value
+
+    async def _run_steps_async(self, steps):
+        """Carry out the conversions of rendering steps concurrently."""
+        try:
+            conversions = next(steps)
+            while True:
+                outputs = await asyncio.gather(
+                    *(
+                        self._convert_async(pandoc_cmd, text, label)
+                        for pandoc_cmd, text, label in conversions
+                    )
+                )
+                conversions = steps.send(list(outputs))
+        except StopIteration as finished:
+            return finished.value
+
+    def _run_batch_steps(self, steps):
+        """Carry out the conversions of the rendering steps of many files.
+
+        Steps maps every file to its rendering steps. Conversions the files
+        need at the same time with the same command are carried out in one
+        pandoc run where the command allows it. Return a dictionary mapping
+        every file to its result or to the exception raised rendering it.
+        """
+        results = {}
+        outputs = dict.fromkeys(steps)
+        while outputs:
+            pending = {}
+            for source_path, step_outputs in outputs.items():
+                errors = [
+                    output
+                    for output in step_outputs or []
+                    if isinstance(output, Exception)
+                ]
+                try:
+                    if errors:
+                        steps[source_path].close()
+                        raise errors[0]
+                    with profile_document(self.settings, source_path):
+                        pending[source_path] = steps[source_path].send(
+                            step_outputs
+                        )
+                except StopIteration as finished:
+                    results[source_path] = finished.value
+                except Exception as error:  # pylint: disable=broad-except
+                    results[source_path] = error
+
+            # Group the conversions by command, keeping their position
+            groups = {}
+            for source_path, conversions in pending.items():
+                for index, (pandoc_cmd, text, label) in enumerate(conversions):
+                    groups.setdefault(tuple(pandoc_cmd), []).append(
+                        (source_path, index, text, label)
+                    )
+
+            outputs = {
+                source_path: [None] * len(conversions)
+                for source_path, conversions in pending.items()
+            }
+            for pandoc_cmd, group in groups.items():
+                group_outputs = self._convert_batch(
+                    list(pandoc_cmd),
+                    [
+                        (source_path, text, label)
+                        for source_path, _, text, label in group
+                    ],
+                )
+                for (source_path, index, _, _), output in zip(
+                    group, group_outputs
+                ):
+                    outputs[source_path][index] = output
+        return results
+
+    def _convert_batch(self, pandoc_cmd, conversions):
+        """Carry out conversions of several files sharing a single command.
+
+        The conversions are given as the file, the text to convert and the
+        label of the conversion. They are carried out in one pandoc run if
+        the command allows it, otherwise, or if they fail in that run, one
+        at a time. Return the output of every conversion or the exception
+        it raised.
+        """
+        outputs = [None] * len(conversions)
+        batch_cmd = None
+        if len(conversions) > 1:
+            batch_cmd = self._create_batch_command(pandoc_cmd)
+        if batch_cmd is not None:
+            try:
+                outputs = self._run_batch(batch_cmd, pandoc_cmd, conversions)
+            except (
+                OSError,
+                LookupError,
+                ValueError,
+                subprocess.CalledProcessError,
+            ) as error:
+                logger.debug(
+                    "Converting a batch of %d documents failed: %s",
+                    len(conversions),
+                    error,
+                )
+
+        # Errors are reported for the conversion causing them
+        for index, (source_path, text, label) in enumerate(conversions):
+            if outputs[index] is not None:
+                continue
+            try:
+                with profile_document(self.settings, source_path):
+                    outputs[index] = self._convert(pandoc_cmd, text, label)
+            except Exception as error:  # pylint: disable=broad-except
+                outputs[index] = error
+        return outputs
+
+    def _run_batch(self, batch_cmd, pandoc_cmd, conversions):
+        """Convert the texts of several conversions in a single pandoc run.
+
+        Every text becomes a code block of a JSON AST, which the batch
+        filter reads and writes as a document of its own, so that the
+        outputs are the same as those of converting each text on its own.
+        Pandoc expands tabs before reading its input, which the filter
+        cannot do, so it is done here. Return the output of every
+        conversion or None for those that failed.
+        """
+        tab_stop = self._get_tab_stop(pandoc_cmd)
+        texts = [text for _, text, _ in conversions]
+        if tab_stop is not None:
+            texts = [text.expandtabs(tab_stop) for text in texts]
+
+        token = uuid.uuid4().hex
+        separator = BATCH_SEPARATOR.format(token)
+        failure = BATCH_FAILURE.format(token)
+        attributes = [
+            ["from", pandoc_cmd[2]],
+            ["to", pandoc_cmd[4]],
+            ["separator", separator],
+            ["failure", failure],
+        ]
+        document = {
+            "pandoc-api-version": get_pandoc_api_version(pandoc_cmd[0]),
+            "meta": {},
+            "blocks": [
+                {"t": "CodeBlock", "c": [["", [], attributes], text]}
+                for text in texts
+            ],
+        }
+
+        start = time.perf_counter()
+        output = self._convert(batch_cmd, json.dumps(document), "batch")
+        outputs = output.split(separator)[1:-1]
+        if len(outputs) != len(conversions):
+            raise ValueError("Unexpected number of documents in output.")
+
+        # Pandoc ends output without a template with a line break of its own
+        line_break = "" if "--standalone" in pandoc_cmd else "\n"
+        outputs = [
+            None if output == failure else output + line_break
+            for output in outputs
+        ]
+
+        # Every file is profiled with its share of the run
+        profile = get_build_profile(self.settings)
+        if profile is not None:
+            share = (time.perf_counter() - start) / len(conversions)
+            for (source_path, text, label), output in zip(
+                conversions, outputs
+            ):
+                if output is None:
+                    continue
+                source_path = os.path.abspath(source_path)
+                profile.add_pandoc_run(
+                    source_path,
+                    "batch:" + label,
+                    share,
+                    len(text),
+                    len(output),
+                )
+                profile.add_phase(source_path, "total", share)
+        return outputs
+
+    @staticmethod
+    def _create_batch_command(pandoc_cmd):
+        """Return the command converting a batch of texts like pandoc_cmd.
+
+        Return None if the command uses default files or options that
+        cannot be applied to each document of a batch, such as citations,
+        whose bibliographies differ between files, or filters, which see
+        the whole batch. Older versions of pandoc lack the functions the
+        batch filter relies on.
+        """
+        if pandoc_cmd[1:2] != ["--from"] or len(pandoc_cmd) < 5:
+            return None
+        if get_pandoc_version(pandoc_cmd[0]) < BATCH_PANDOC_VERSION:
+            return None
+
+        # Pandoc applies this extension to its input as a whole
+        if "+east_asian_line_breaks" in pandoc_cmd[2]:
+            return None
+        batch_cmd = [pandoc_cmd[0], "--from", "json", "--to", "html"]
+
+        # Values given as separate arguments go with their option
+        option = None
+        for argument in pandoc_cmd[5:]:
+            if argument.partition("=")[0] in BATCH_OPTIONS:
+                option = argument
+            elif option is None or argument.startswith("-"):
+                return None
+            batch_cmd.append(argument)
+        return batch_cmd + [
+            "--lua-filter={}".format(os.path.join(FILTERS_PATH, BATCH_FILTER))
+        ]
+
+    @staticmethod
+    def _get_tab_stop(pandoc_cmd):
+        """Return the tab stop pandoc expands tabs to or None if it does not.
+
+        The command is expected to give values as separate arguments or
+        joined with an equals sign.
+        """
+        tab_stop = 4
+        for index, argument in enumerate(pandoc_cmd):
+            option, _, value = argument.partition("=")
+            if option in ("--preserve-tabs", "-p"):
+                return None
+            if option == "--tab-stop":
+                tab_stop = int(value or pandoc_cmd[index + 1])
+        return tab_stop
+
+    def _render_steps(self, content, pandoc_cmd, table_of_contents):
+        """Return the raw rendered parts, yielding the conversions needed.
+
+        The content, along with the table of contents, and the formatted
+        fields are converted at the same time.
+        """
+        # Count words and more while pandoc is converting the content
+        count_with_pandoc = self._get_word_count_method() == "pandoc"
+        html_cmd = pandoc_cmd
+        if count_with_pandoc:
+            html_cmd = pandoc_cmd + self._get_statistics_args()
+
+        # Create HTML content along with the table of contents if requested
+        if table_of_contents:
+            html_cmd = html_cmd + self._get_toc_args()
+
         # Parse YAML metadata placed in the document's header
-        metadata = self._process_header_metadata(
-            list(content.splitlines()), metadata, pandoc_cmd
+        fields = self._parse_header(content)
+        output, formatted = yield from gather_steps(
+            convert_step(
+                html_cmd, content, "body+toc" if table_of_contents else "body"
+            ),
+            self._convert_formatted_fields_steps(pandoc_cmd, fields),
         )
 
-        return output, metadata
+        # Takes care of metadata that should be converted to HTML
+        fields.update(formatted)
+
+        toc = None
+        if table_of_contents:
+            output, toc = self._split_toc(output)
+
+        statistics = None
+        if count_with_pandoc:
+            output, statistics = self._split_statistics(output)
+
+        # Replace all occurrences of %7Bstatic%7D to {static},
+        # %7Battach%7D to {attach} and %7Bfilename%7D to {filename}
+        # so that static links are resolvable by pelican
+        output = self._restore_links(output)
+
+        reading_time = None
+        if self.settings.get("CALCULATE_READING_TIME", []):
+            # Calculate reading time
+            with profile_phase("reading_time"):
+                reading_time = self._calculate_reading_time(
+                    content, statistics
+                )
+
+        return RenderedDocument(
+            output,
+            toc,
+            reading_time,
+            fields,
+            statistics,
+            compress=self._get_compress(),
+        )
+
+    @staticmethod
+    def _hash_dependencies(config, bib_files):
+        """Hash the files read when rendering with the given configuration.
+
+        Return a dictionary mapping every file to the hash of its contents
+        or None if any of them cannot be read.
+        """
+        if config["dependencies"] is None:
+            return None
+
+        dependencies = {}
+        for path in config["dependencies"] + bib_files + PLUGIN_FILES:
+            file_hash = get_file_hash(path)
+            if file_hash is None:
+                return None
+            dependencies[path] = file_hash
+        return dependencies
+
+    def _create_settings_digest(self, config):
+        """Hash the settings that can influence the rendered output."""
+        key_data = {
+            "version": CACHE_FORMAT_VERSION,
+            "pandoc": get_pandoc_version(config["pandoc_cmd"][0]),
+            "command": config["pandoc_cmd"],
+            "formatted_fields": list(
+                self.settings.get("FORMATTED_FIELDS", [])
+            ),
+            "reading_time": bool(
+                self.settings.get("CALCULATE_READING_TIME", [])
+            ),
+            "reading_speed": str(
+                self.settings.get("READING_SPEED", DEFAULT_READING_SPEED)
+            ),
+            "word_count_method": str(
+                self.settings.get("WORD_COUNT_METHOD", "mwc")
+            ),
+            "link_placeholders": list(
+                self.settings.get("PANDOC_LINK_PLACEHOLDERS", [])
+            ),
+        }
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _create_cache_key(content, settings_digest, dependencies):
+        """Hash everything that can influence the rendered output."""
+        digest = hashlib.sha256(settings_digest.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content.encode("utf-8"))
+
+        # Default files, bibliographies, filters and the like are referenced
+        # by path so their contents have to be part of the key as well
+        for path, file_hash in sorted(dependencies.items()):
+            digest.update("\0{}\0{}".format(path, file_hash).encode("utf-8"))
+        return digest.hexdigest()
 
     def _validate_fields(self, default_files, arguments, extensions):
         """Validate fields and return citations and ToC request values."""
@@ -149,24 +1100,93 @@ class PandocReader(BaseReader):
 
         return citations, table_of_contents
 
-    def _create_toc(self, pandoc_cmd, content):
-        """Generate table of contents."""
-        toc_args = [
+    @staticmethod
+    def _get_toc_args():
+        """Return the arguments adding the table of contents to the output.
+
+        The template places the table of contents in front of the body
+        with a separator in between so both can be recovered from the
+        output of a single pandoc run.
+        """
+        return [
             "--standalone",
             "--template",
-            os.path.join(TEMPLATES_PATH, TOC_TEMPLATE),
+            TOC_TEMPLATE_PATH,
         ]
 
-        pandoc_cmd = pandoc_cmd + toc_args
-        table_of_contents = self._run_pandoc(pandoc_cmd, content)
-        return table_of_contents
+    @staticmethod
+    def _split_toc(output):
+        """Split output rendered with the table of contents template."""
+        table_of_contents, _, output = output.partition(TOC_BODY_SEPARATOR)
+        return output, table_of_contents
+
+    def _restore_links(self, output):
+        """Restore the placeholders of links encoded by pandoc.
+
+        Output without encoded braces is returned as it is. Otherwise
+        every placeholder is replaced on its own, which is faster than
+        any single pass over the output that has to run Python code for
+        each match.
+        """
+        replacements = get_link_replacements(
+            self.settings.get("PANDOC_LINK_PLACEHOLDERS", [])
+        )
+        if "%7B" not in output:
+            return output
+        for encoded_str, raw_str in replacements:
+            output = output.replace(encoded_str, raw_str)
+        return output
+
+    def _get_word_count_method(self):
+        """Return the configured word count method if it is valid."""
+        method = self.settings.get("WORD_COUNT_METHOD", "mwc")
+        if method not in WORD_COUNT_METHODS:
+            raise ValueError(
+                "WORD_COUNT_METHOD setting must be either {} or {}.".format(
+                    ", ".join(WORD_COUNT_METHODS[:-1]), WORD_COUNT_METHODS[-1]
+                )
+            )
+        return method
+
+    @staticmethod
+    def _get_statistics_args():
+        """Return the arguments making pandoc count words and more."""
+        return [
+            "--lua-filter={}".format(
+                os.path.join(FILTERS_PATH, STATISTICS_FILTER)
+            )
+        ]
+
+    @staticmethod
+    def _split_statistics(output):
+        """Split the statistics appended by the filter from the output."""
+        head, marker, tail = output.rpartition(STATISTICS_MARKER)
+        if not marker:
+            return output, None
 
-    def _calculate_reading_time(self, content):
+        values, _, tail = tail.partition(" -->")
+        statistics = dict(
+            zip(STATISTICS, (int(value) for value in values.split()))
+        )
+
+        # The comment is a block of its own, pandoc ends the output with
+        # a single line break when the comment is all there is
+        if head and tail.startswith("\n"):
+            tail = tail[1:]
+        return head + tail, statistics
+
+    def _calculate_reading_time(self, content, statistics=None):
         """Calculate time taken to read content."""
         reading_speed = self.settings.get(
             "READING_SPEED", DEFAULT_READING_SPEED
         )
-        wordcount = count_words_in_markdown(content)
+        method = self._get_word_count_method()
+        if method == "pandoc":
+            wordcount = statistics["words"]
+        elif method == "native":
+            wordcount = count_words(content)
+        else:
+            wordcount = count_words_in_markdown(content)
 
         time_unit = "minutes"
         try:
@@ -181,49 +1201,166 @@ class PandocReader(BaseReader):
 
         return reading_time
 
-    def _process_header_metadata(self, content, metadata, pandoc_cmd):
-        """Process YAML metadata and export."""
-        # Check that the given text is not empty
-        if not content:
-            raise Exception("Could not find metadata. File is empty.")
-
-        # Check that the first line of the file starts with a YAML header
-        if content[0].strip() not in ["---", "..."]:
-            raise Exception("Could not find metadata header '...' or '---'.")
-
-        # Find the end of the YAML block
-        lines = content[1:]
-        yaml_end = ""
-        for line_num, line in enumerate(lines):
-            if line.strip() in ["---", "..."]:
-                yaml_end = line_num
-                break
-
-        # Check if the end of the YAML block was found
-        if not yaml_end:
-            raise Exception("Could not find end of metadata block.")
+    def _parse_header(self, content):
+        """Return the raw field values of the YAML header of content."""
+        with profile_phase("header"):
+            header_lines, _ = scan_front_matter(content)
+            return self._parse_header_lines(header_lines)
 
-        # Process the YAML block
-        for line in lines[:yaml_end]:
+    @staticmethod
+    def _parse_header_lines(header_lines):
+        """Return the raw field values of the lines of a YAML header."""
+        metadata = {}
+        for line in header_lines:
             metalist = line.split(":", 1)
             if len(metalist) == 2:
                 key, value = (
                     metalist[0].lower(),
                     metalist[1].strip().strip('"'),
                 )
-                # Takes care of metadata that should be converted to HTML
-                if key in self.settings["FORMATTED_FIELDS"]:
-                    value = self._run_pandoc(pandoc_cmd, value)
-                metadata[key] = self.process_metadata(key, value)
+                metadata[key] = value
         return metadata
 
+    def _convert_formatted_fields(self, pandoc_cmd, metadata):
+        """Convert the values of formatted fields to HTML."""
+        return self._run_steps(
+            self._convert_formatted_fields_steps(pandoc_cmd, metadata)
+        )
+
+    def _convert_formatted_fields_steps(self, pandoc_cmd, metadata):
+        """Convert formatted fields, yielding the conversions needed."""
+        formatted_keys = [
+            key for key in metadata if key in self.settings["FORMATTED_FIELDS"]
+        ]
+
+        # Values converted before with the same command are not converted
+        # again if the memo is enabled
+        memo = get_field_memo(self.settings)
+        formatted = {}
+        memo_keys = {}
+        if memo is not None:
+            for key in formatted_keys:
+                memo_key = self._create_field_key(pandoc_cmd, metadata[key])
+                if memo_key is None:
+                    continue
+                output = memo.get(memo_key)
+                if output is None:
+                    memo_keys[key] = memo_key
+                else:
+                    formatted[key] = output
+            formatted_keys = [
+                key for key in formatted_keys if key not in formatted
+            ]
+
+        batch_keys = [
+            key for key in formatted_keys if self._can_share_run(metadata[key])
+        ]
+
+        # Citeproc appends the references to the end of the document, which
+        # would leave them in the last of the batched fields only
+        citeproc = self._get_pandoc_config()["citeproc"]
+        if len(batch_keys) < 2 or citeproc:
+            batch_keys = []
+        single_keys = [key for key in formatted_keys if key not in batch_keys]
+
+        # Convert anything that cannot share a pandoc run on its own
+        conversions = [
+            (pandoc_cmd, metadata[key], "field:" + key) for key in single_keys
+        ]
+        if batch_keys:
+            conversions.append(
+                (
+                    pandoc_cmd,
+                    self._join_segments([metadata[key] for key in batch_keys]),
+                    "fields:" + ",".join(batch_keys),
+                )
+            )
+        if not conversions:
+            return formatted
+        outputs = yield conversions
+
+        formatted.update(zip(single_keys, outputs))
+        if batch_keys:
+            batch_outputs = self._split_segments(outputs[-1], len(batch_keys))
+            if batch_outputs is None:
+                # Fall back to converting every field on its own
+                batch_outputs = yield [
+                    (pandoc_cmd, metadata[key], "field:" + key)
+                    for key in batch_keys
+                ]
+            formatted.update(zip(batch_keys, batch_outputs))
+
+        for key, memo_key in memo_keys.items():
+            memo.set(memo_key, formatted[key])
+        return formatted
+
+    def _create_field_key(self, pandoc_cmd, value):
+        """Return the memo key of converting a formatted field value.
+
+        Like cache keys, the key covers the version of pandoc and the
+        contents of the files the command reads. Return None if any of them
+        cannot be found.
+        """
+        config = self._get_pandoc_config()
+        if config["dependencies"] is None:
+            return None
+        bib_files = [
+            argument.partition("=")[2]
+            for argument in pandoc_cmd
+            if argument.startswith("--bibliography=")
+        ]
+
+        dependencies = {}
+        for path in config["dependencies"] + bib_files:
+            file_hash = get_file_hash(path)
+            if file_hash is None:
+                return None
+            dependencies[path] = file_hash
+        key_data = [
+            CACHE_FORMAT_VERSION,
+            get_pandoc_version(pandoc_cmd[0]),
+            pandoc_cmd,
+            dependencies,
+            value,
+        ]
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _join_segments(segments):
+        """Join segments into a single document for one pandoc run."""
+        separator = "\n\n{}\n\n".format(SEGMENT_SEPARATOR)
+        return separator.join(segments)
+
     @staticmethod
-    def _construct_pandoc_command(default_files, arguments, extensions):
+    def _split_segments(output, count):
+        """Split the output of joined segments or return None if it fails."""
+        outputs = output.split("<p>{}</p>\n".format(SEGMENT_SEPARATOR))
+        if len(outputs) != count:
+            return None
+
+        # A segment that opened a block without closing it has swallowed
+        # the separator and the segments following it
+        for segment_output in outputs:
+            depth = 0
+            for match in SEGMENT_BLOCK_TAGS.finditer(segment_output):
+                depth += -1 if match.group(1) else 1
+                if depth < 0:
+                    return None
+            if depth:
+                return None
+        return outputs
+
+    @staticmethod
+    def _construct_pandoc_command(
+        default_files, arguments, extensions, pandoc_path="pandoc"
+    ):
         """Construct Pandoc command for content."""
         pandoc_cmd = []
         if not default_files:
             pandoc_cmd = [
-                "pandoc",
+                pandoc_path,
                 "--from",
                 "markdown" + extensions,
                 "--to",
@@ -231,11 +1368,58 @@ class PandocReader(BaseReader):
             ]
             pandoc_cmd.extend(arguments)
         else:
-            pandoc_cmd = ["pandoc"]
+            pandoc_cmd = [pandoc_path]
             for default_file in default_files:
                 pandoc_cmd.append("--defaults={0}".format(default_file))
         return pandoc_cmd
 
+    def _convert(self, pandoc_cmd, content, label="pandoc"):
+        """Convert content using the configured pandoc backend.
+
+        The label names the conversion in the build profile.
+        """
+        backend = self._get_backend()
+        start = time.perf_counter()
+        output = None
+        if backend == "server":
+            server = get_pandoc_server(self.settings)
+            output = server.convert(pandoc_cmd, content)
+        if output is None:
+            output = self._run_pandoc(pandoc_cmd, content)
+        profile_pandoc_run(label, start, content, output)
+        return output
+
+    async def _convert_async(self, pandoc_cmd, content, label="pandoc"):
+        """Convert content using the configured backend asynchronously.
+
+        The number of conversions running at the same time is bounded by
+        PANDOC_ASYNC_PROCESSES, whichever backend is used.
+        """
+        backend = self._get_backend()
+        async with get_async_semaphore(self.settings):
+            start = time.perf_counter()
+            output = None
+            if backend == "server":
+                # The server client blocks, so it is run in a thread
+                server = get_pandoc_server(self.settings)
+                output = await asyncio.get_event_loop().run_in_executor(
+                    None, server.convert, pandoc_cmd, content
+                )
+            if output is None:
+                output = await self._run_pandoc_async(pandoc_cmd, content)
+        profile_pandoc_run(label, start, content, output)
+        return output
+
+    def _get_backend(self):
+        """Return the configured pandoc backend if it is valid."""
+        backend = self.settings.get("PANDOC_BACKEND", "subprocess")
+        if backend not in VALID_BACKENDS:
+            backends = " or ".join(VALID_BACKENDS)
+            raise ValueError(
+                "PANDOC_BACKEND must be either {}.".format(backends)
+            )
+        return backend
+
     @staticmethod
     def _run_pandoc(pandoc_cmd, content):
         """Execute the given pandoc command and return output."""
@@ -248,6 +1432,130 @@ class PandocReader(BaseReader):
         )
         return output.stdout
 
+    @staticmethod
+    async def _run_pandoc_async(pandoc_cmd, content):
+        """Execute the given pandoc command in an asyncio subprocess."""
+        process = await asyncio.create_subprocess_exec(
+            *pandoc_cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate(content.encode("utf-8"))
+
+        # Decode the output the way subprocess.run does for text
+        stdout, stderr = (
+            data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+            for data in (stdout, stderr)
+        )
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, pandoc_cmd, stdout, stderr
+            )
+        return stdout
+
+    @staticmethod
+    def _find_file_dependencies(pandoc_cmd):
+        """Find the files read by pandoc when running the given command.
+
+        Return None if a file cannot be located. Remote resources are
+        identified by their URL, which is already part of the command.
+        """
+        file_values = []
+        arguments = iter(pandoc_cmd[1:])
+        for argument in arguments:
+            option, has_value, value = argument.partition("=")
+            if option in FILE_OPTIONS:
+                if not has_value:
+                    value = next(arguments, "")
+            elif argument[:2] in FILE_OPTIONS and len(argument) > 2:
+                option, value = argument[:2], argument[2:]
+            else:
+                continue
+            file_values.append((option, value))
+
+        dependencies = []
+        while file_values:
+            option, value = file_values.pop(0)
+            if "://" in value:
+                continue
+
+            path = value
+            if not os.path.isfile(path) and option in ("--filter", "-F"):
+                # Filters may also be executables on the PATH
+                path = shutil.which(value) or value
+            if not os.path.isfile(path):
+                return None
+            dependencies.append(path)
+
+            if option in ("--defaults", "-d"):
+                with open(path) as file_handle:
+                    defaults = safe_load(file_handle) or {}
+                for key in DEFAULTS_FILE_KEYS:
+                    values = defaults.get(key) or []
+                    if not isinstance(values, list):
+                        values = [values]
+                    for entry in values:
+                        if isinstance(entry, dict):
+                            entry = entry.get("path", "")
+                        if key == "filters" and entry == "citeproc":
+                            continue
+                        option = "--filter" if key == "filters" else key
+                        file_values.append((option, entry))
+        return dependencies
+
+    @staticmethod
+    def _check_if_citeproc(pandoc_cmd):
+        """Check if the given pandoc command runs citeproc."""
+        for argument in pandoc_cmd[1:]:
+            if argument in ("--citeproc", "-C"):
+                return True
+            if argument.startswith("--defaults="):
+                with open(argument.partition("=")[2]) as file_handle:
+                    defaults = safe_load(file_handle) or {}
+                if defaults.get("citeproc", ""):
+                    return True
+        return False
+
+    @staticmethod
+    def _get_dependency_signature(dependencies):
+        """Return a value that changes whenever a dependency changes."""
+        return [get_file_signature(path) for path in dependencies or []]
+
+    @staticmethod
+    def _check_if_nocite(pandoc_cmd, dependencies):
+        """Check if the given pandoc command may cite without citations."""
+        if dependencies is None:
+            return True
+        if any("nocite" in argument for argument in pandoc_cmd[1:]):
+            return True
+        for path in dependencies:
+            with open(path, "rb") as file_handle:
+                if b"nocite" in file_handle.read():
+                    return True
+        return False
+
+    @staticmethod
+    def _find_citation_keys(content):
+        """Find every key that may be cited in the given content.
+
+        Pandoc drops punctuation at the end of a key, both variants are
+        kept as the citation may end either way.
+        """
+        keys = set()
+        for match in CITATION_KEY.finditer(content):
+            key = match.group(1) or match.group(2) or ""
+            keys.add(key)
+            keys.add(key.rstrip(CITATION_KEY_PUNCTUATION))
+        return keys
+
+    @staticmethod
+    def _can_share_run(value):
+        """Check if a value can be converted alongside other values."""
+        if not value or value.startswith("#"):
+            return False
+        return not any(marker in value for marker in ISOLATED_SEGMENT_MARKERS)
+
     @staticmethod
     def _check_if_citations(arguments, extensions):
         """Check if citations are specified."""
@@ -268,18 +1576,11 @@ class PandocReader(BaseReader):
                 table_of_contents = True
         return table_of_contents
 
-    @staticmethod
-    def _find_bibs(source_path):
+    def _find_bibs(self, source_path):
         """Find bibliographies recursively in the sourcepath given."""
-        bib_files = []
-        filename = os.path.splitext(os.path.basename(source_path))[0]
-        directory_path = os.path.dirname(os.path.abspath(source_path))
-        for root, _, files in os.walk(directory_path):
-            for extension in VALID_BIB_EXTENSIONS:
-                bib_name = ".".join([filename, extension])
-                if bib_name in files:
-                    bib_files.append(os.path.join(root, bib_name))
-        return bib_files
+        return get_bibliography_index(self.settings, source_path).find(
+            source_path
+        )
 
     @staticmethod
     def _check_arguments(arguments):
@@ -357,6 +1658,1832 @@ class PandocReader(BaseReader):
             )
 
 
+class LazyRendering:
+    """Rendering of a file that is produced the first time it is needed.
+
+    The file is rendered at most once, even if several threads ask for the
+    rendering at the same time.
+    """
+
+    def __init__(self, reader, source_path):
+        self.reader = reader
+        self.source_path = source_path
+        self._rendered = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the output and processed table of contents of the file.
+
+        The file is rendered if needed. The rendering itself may be shared
+        with caches, so it is left as it is.
+        """
+        if self._rendered is None:
+            with self._lock:
+                if self._rendered is None:
+                    signature = get_file_signature(self.source_path)
+                    with pelican_open(self.source_path) as content:
+                        rendered = self.reader._render_source(
+                            self.source_path, content, signature
+                        )
+                    toc = rendered.toc
+                    if toc is not None:
+                        toc = self.reader.process_metadata("toc", toc)
+                    self._rendered = {"output": rendered.output, "toc": toc}
+        return self._rendered
+
+
+class LazyContent:
+    """String-compatible view of a part of a lazy rendering.
+
+    Using the object in place of a string renders the file. Templates
+    treat it as safe markup and pickling stores the rendered string.
+    """
+
+    def __init__(self, rendering, key="output"):
+        self.rendering = rendering
+        self.key = key
+
+    def __str__(self):
+        return self.rendering.get()[self.key]
+
+    def __html__(self):
+        return str(self)
+
+    def __repr__(self):
+        return "<{} {} of {}>".format(
+            type(self).__name__, self.key, self.rendering.source_path
+        )
+
+    def __reduce__(self):
+        return str, (str(self),)
+
+    def __getattr__(self, name):
+        # Delegate string methods such as replace or startswith
+        if name.startswith("__") or name in ("rendering", "key"):
+            raise AttributeError(name)
+        return getattr(str(self), name)
+
+    def __len__(self):
+        return len(str(self))
+
+    def __bool__(self):
+        return bool(str(self))
+
+    def __contains__(self, item):
+        return item in str(self)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getitem__(self, index):
+        return str(self)[index]
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+
+class RenderedDocument:
+    """Compact record of the rendering of a single document.
+
+    Holds the HTML body, the table of contents, the raw header fields, the
+    reading time and the statistics of a document. Renderings are kept by
+    caches and workers in large numbers, so the record has no instance
+    dictionary, interns the keys of the header fields, which recur in
+    every document, and may keep the body compressed with zlib until it is
+    asked for.
+    """
+
+    __slots__ = (
+        "_output",
+        "_compressed",
+        "toc",
+        "reading_time",
+        "fields",
+        "statistics",
+    )
+
+    def __init__(
+        self,
+        output,
+        toc=None,
+        reading_time=None,
+        fields=None,
+        statistics=None,
+        compress=False,
+    ):
+        self._compressed = compress and output is not None
+        if self._compressed:
+            output = zlib.compress(output.encode("utf-8"))
+        self._output = output
+        self.toc = toc
+        self.reading_time = reading_time
+        self.fields = {
+            sys.intern(key): value for key, value in (fields or {}).items()
+        }
+        self.statistics = statistics
+
+    @property
+    def output(self):
+        """Return the HTML body, decompressing it if needed."""
+        if self._compressed:
+            return zlib.decompress(self._output).decode("utf-8")
+        return self._output
+
+    @property
+    def compressed(self):
+        """Check if the HTML body is kept compressed."""
+        return self._compressed
+
+    def to_dict(self):
+        """Return the rendering as a dictionary that can be stored as JSON."""
+        return {
+            "output": self.output,
+            "toc": self.toc,
+            "reading_time": self.reading_time,
+            "fields": dict(self.fields),
+            "statistics": self.statistics,
+        }
+
+    @classmethod
+    def from_dict(cls, data, compress=False):
+        """Return the rendering stored as a dictionary by to_dict."""
+        return cls(
+            data["output"],
+            data.get("toc"),
+            data.get("reading_time"),
+            data.get("fields"),
+            data.get("statistics"),
+            compress,
+        )
+
+
+def count_words(content):
+    """Count the words read in Pandoc Markdown content.
+
+    The content is scanned once without being copied. The YAML header,
+    code, math, raw HTML, images and link targets are not counted.
+    """
+    start = 0
+    try:
+        _, start = scan_front_matter(content)
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+    # Words are matched in runs separated by single spaces to save on
+    # matches, so every space in a run separates two words
+    wordcount = 0
+    for match in WORD_COUNT_TOKENS.finditer(content, start):
+        if match.lastgroup == "words":
+            wordcount += match.group().count(" ") + 1
+    return wordcount
+
+
+def convert_step(pandoc_cmd, text, label):
+    """Convert text with a single pandoc command as a rendering step."""
+    (output,) = yield [(pandoc_cmd, text, label)]
+    return output
+
+
+def gather_steps(*steps):
+    """Run several rendering steps side by side and return their results.
+
+    The conversions the steps yield at the same time are yielded together,
+    so that they can be carried out concurrently.
+    """
+    results = [None] * len(steps)
+    pending = {}
+    for index, step in enumerate(steps):
+        try:
+            pending[index] = next(step)
+        except StopIteration as finished:
+            results[index] = finished.value
+
+    while pending:
+        outputs = yield [
+            conversion
+            for conversions in pending.values()
+            for conversion in conversions
+        ]
+        start = 0
+        for index, conversions in list(pending.items()):
+            step_outputs = outputs[start : start + len(conversions)]
+            start += len(conversions)
+            try:
+                pending[index] = steps[index].send(step_outputs)
+            except StopIteration as finished:
+                results[index] = finished.value
+                del pending[index]
+    return results
+
+
+def iter_lines(text):
+    """Yield every line of text along with the offset following it.
+
+    Lines are split like str.splitlines does, but one at a time, so that
+    the lines of a large document are never all held in memory.
+    """
+    start = 0
+    for match in LINE_BREAK.finditer(text):
+        yield text[start : match.start()], match.end()
+        start = match.end()
+    if start < len(text):
+        yield text[start:], len(text)
+
+
+def find_front_matter(lines):
+    """Return the YAML header lines and the offset of the body.
+
+    The lines, given along with the offset following each of them, are
+    only consumed up to the delimiter closing the header.
+    """
+    lines = iter(lines)
+
+    # Check that the given text is not empty
+    first_line = next(lines, None)
+    if first_line is None:
+        raise Exception("Could not find metadata. File is empty.")
+
+    # Check that the first line of the file starts with a YAML header
+    if first_line[0].strip() not in FRONT_MATTER_DELIMITERS:
+        raise Exception("Could not find metadata header '...' or '---'.")
+
+    # Find the end of the YAML block, an empty block is not considered
+    # to be closed
+    header_lines = []
+    for line, offset in lines:
+        if line.strip() in FRONT_MATTER_DELIMITERS:
+            if header_lines:
+                return header_lines, offset
+            break
+        header_lines.append(line)
+    raise Exception("Could not find end of metadata block.")
+
+
+def scan_front_matter(content):
+    """Return the YAML header lines of content and the offset of the body."""
+    return find_front_matter(iter_lines(content))
+
+
+def read_front_matter(source_path):
+    """Return the YAML header lines of a file and the offset of the body.
+
+    Only the header is read from disk. The file is decoded like Pelican
+    does and the offset is given in characters of the decoded text.
+    """
+
+    def file_lines(file_handle):
+        offset = 0
+        for line in file_handle:
+            for part, end in iter_lines(line):
+                yield part, offset + end
+            offset += len(line)
+
+    with open(source_path, encoding="utf-8-sig") as file_handle:
+        return find_front_matter(file_lines(file_handle))
+
+
+class RenderCache:
+    """Size-bounded on-disk cache of rendered documents.
+
+    Entries are JSON files named after their key. The modification time of
+    an entry is bumped on every hit so that the least recently used entries
+    are the first to go once the cache grows beyond its maximum size. The
+    pruned bibliographies kept in the cache directory count as entries too.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached value for key or None if there is none."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, encoding="utf-8") as file_handle:
+                value = json.load(file_handle)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def contains(self, key):
+        """Check if there is a cached value for key."""
+        return os.path.exists(self._entry_path(key))
+
+    def set(self, key, value):
+        """Atomically store value under key and evict old entries."""
+        data = json.dumps(value).encode("utf-8")
+        temp_path = None
+        try:
+            file_descriptor, temp_path = tempfile.mkstemp(
+                dir=self.path, suffix=".tmp"
+            )
+            with os.fdopen(file_descriptor, "wb") as file_handle:
+                file_handle.write(data)
+            os.replace(temp_path, self._entry_path(key))
+        except OSError as error:
+            # A cache that cannot be written to should not fail the build
+            logger.warning(
+                "Could not write to pandoc cache at %s: %s", self.path, error
+            )
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+        self.add_file(len(data))
+
+    def add_file(self, size, path=None):
+        """Count a file of size bytes just written to the cache directory.
+
+        Least recently used entries are evicted if the cache grew beyond its
+        maximum size, except for the file at path, which is about to be used.
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(
+                    entry_size for _, entry_size, _ in self._entries()
+                )
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict(path)
+
+    def _evict(self, keep_path=None):
+        """Remove least recently used entries until the cache fits."""
+        # Shrink a little below the limit so that eviction is not
+        # triggered again by the very next write
+        target_size = self.max_size * 0.9
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self._size <= target_size:
+                break
+            if entry_path == keep_path:
+                continue
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def _entries(self):
+        """Yield path, size and last use time of every entry."""
+        for directory in (
+            self.path,
+            os.path.join(self.path, BIBLIOGRAPHIES_DIRECTORY),
+        ):
+            try:
+                dir_entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with dir_entries:
+                for dir_entry in dir_entries:
+                    if not dir_entry.name.endswith((".json", ".yaml")):
+                        continue
+                    try:
+                        stat = dir_entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield dir_entry.path, stat.st_size, stat.st_mtime
+
+    def _entry_path(self, key):
+        """Return the path of the file holding the entry for key."""
+        return os.path.join(self.path, "{}.json".format(key))
+
+
+class BuildManifest:
+    """Record of the inputs every file was last rendered from.
+
+    For every source file the manifest keeps its signature, a digest of
+    the settings, the hashes of all other files read while rendering it
+    and the key of its rendering in the render cache. A file whose inputs
+    are all unchanged does not have to be rendered again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as file_handle:
+                manifest = json.load(file_handle)
+        except (OSError, ValueError):
+            return
+        if (
+            isinstance(manifest, dict)
+            and manifest.get("version") == CACHE_FORMAT_VERSION
+        ):
+            self._entries = manifest.get("sources", {})
+
+    def get(self, source_path):
+        """Return the entry of a source file or None if there is none."""
+        with self._lock:
+            return self._entries.get(os.path.abspath(source_path))
+
+    def record(
+        self, source_path, signature, settings_digest, dependencies, key
+    ):
+        """Record the inputs a source file has just been rendered from.
+
+        Signature is that of the file when its content was read.
+        """
+        source_path = os.path.abspath(source_path)
+        entry = {
+            "signature": list(signature or []),
+            "settings": settings_digest,
+            "dependencies": dependencies,
+            "key": key,
+        }
+        with self._lock:
+            if self._entries.get(source_path) != entry:
+                self._entries[source_path] = entry
+                self._changed = True
+
+    def save(self):
+        """Atomically write the manifest if it changed since it was loaded.
+
+        Entries of source files that no longer exist are left out.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            entries = {
+                source_path: entry
+                for source_path, entry in self._entries.items()
+                if os.path.exists(source_path)
+            }
+            self._entries = entries
+            self._changed = False
+
+        data = json.dumps(
+            {"version": CACHE_FORMAT_VERSION, "sources": entries},
+            sort_keys=True,
+        )
+        temp_path = None
+        try:
+            file_descriptor, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix=".tmp"
+            )
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.warning(
+                "Could not write pandoc build manifest at %s: %s",
+                self.path,
+                error,
+            )
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+
+class FieldMemo:
+    """Size-bounded memo of formatted field values converted by pandoc.
+
+    Outputs are kept under the key of their conversion and the least
+    recently used ones are dropped once they add up to more than max_size
+    characters. With a path the memo is loaded from and saved to a file.
+    Lookups are counted as hits and misses.
+    """
+
+    def __init__(self, max_size, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._changed = False
+        self._lock = threading.Lock()
+        if path is None:
+            return
+        try:
+            with open(path, encoding="utf-8") as file_handle:
+                memo = json.load(file_handle)
+        except (OSError, ValueError):
+            return
+        if (
+            isinstance(memo, dict)
+            and memo.get("version") == CACHE_FORMAT_VERSION
+        ):
+            for key, output in memo.get("entries", []):
+                self._add(key, output)
+
+    def get(self, key):
+        """Return the output kept under key or None if there is none."""
+        with self._lock:
+            output = self._entries.get(key)
+            if output is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return output
+
+    def set(self, key, output):
+        """Keep output under key and drop the least recently used entries."""
+        with self._lock:
+            self._add(key, output)
+            self._changed = True
+
+    def stats(self):
+        """Return the hits, misses, number of entries and size of the memo."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size": self._size,
+            }
+
+    def save(self):
+        """Atomically write the memo if it changed since it was loaded."""
+        with self._lock:
+            if self.path is None or not self._changed:
+                return
+            entries = list(self._entries.items())
+            self._changed = False
+
+        data = json.dumps(
+            {"version": CACHE_FORMAT_VERSION, "entries": entries}
+        )
+        temp_path = None
+        try:
+            file_descriptor, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix=".tmp"
+            )
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.warning(
+                "Could not write pandoc field memo at %s: %s",
+                self.path,
+                error,
+            )
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _add(self, key, output):
+        """Add an entry and evict old ones, the lock must be held."""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = output
+        self._size += len(output)
+        while self._size > self.max_size and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+class WatchCache:
+    """Renderings kept in memory from one regeneration to the next.
+
+    For every source file the cache keeps the rendering along with the
+    inputs it was rendered from, as the build manifest does, so that a
+    file is only rendered again once itself or any of its inputs changed.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, source_path, settings_digest, dependencies):
+        """Return the rendering of a file if its inputs are unchanged."""
+        source_path = os.path.abspath(source_path)
+        with self._lock:
+            entry = self._entries.get(source_path)
+        if (
+            entry is None
+            or dependencies is None
+            or entry["signature"] != get_file_signature(source_path)
+            or entry["settings"] != settings_digest
+            or entry["dependencies"] != dependencies
+        ):
+            return None
+        return entry["rendered"]
+
+    def record(
+        self, source_path, signature, settings_digest, dependencies, rendered
+    ):
+        """Keep the rendering of a file along with its inputs.
+
+        Signature is that of the file when its content was read.
+        """
+        source_path = os.path.abspath(source_path)
+        entry = {
+            "signature": signature,
+            "settings": settings_digest,
+            "dependencies": dependencies,
+            "rendered": rendered,
+        }
+        with self._lock:
+            self._entries[source_path] = entry
+
+    def prune(self):
+        """Forget the renderings of files that no longer exist."""
+        with self._lock:
+            self._entries = {
+                source_path: entry
+                for source_path, entry in self._entries.items()
+                if os.path.exists(source_path)
+            }
+
+
+_PANDOC_CONFIGS = {}
+_PANDOC_CONFIGS_LOCK = threading.Lock()
+_BUILD_MANIFESTS = {}
+_BUILD_MANIFESTS_LOCK = threading.Lock()
+_FILE_HASHES = {}
+_FILE_HASHES_LOCK = threading.Lock()
+_LINK_REPLACEMENTS = {}
+_RENDER_CACHES = {}
+_RENDER_CACHES_LOCK = threading.Lock()
+_PANDOC_PATHS = {}
+_PANDOC_VERSIONS = {}
+_PANDOC_API_VERSIONS = {}
+_REFERENCES = {}
+_REFERENCES_LOCK = threading.Lock()
+_WATCH_CACHE = WatchCache()
+_FIELD_MEMOS = {}
+_FIELD_MEMOS_LOCK = threading.Lock()
+_BIBLIOGRAPHY_DIRECTORY = None
+_BIBLIOGRAPHY_DIRECTORY_LOCK = threading.Lock()
+
+
+def get_file_signature(path):
+    """Return a value that changes whenever the file at path changes."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_file_hash(path):
+    """Return the hash of the contents of a file or None if not found.
+
+    Files shared by many documents, such as default files and large
+    bibliographies, are only hashed again once they change.
+    """
+    signature = get_file_signature(path)
+    if signature is None:
+        return None
+    with _FILE_HASHES_LOCK:
+        file_signature, file_hash = _FILE_HASHES.get(path, (None, None))
+    if file_hash is not None and file_signature == signature:
+        return file_hash
+
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file_handle:
+            for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    file_hash = digest.hexdigest()
+    with _FILE_HASHES_LOCK:
+        _FILE_HASHES[path] = (signature, file_hash)
+    return file_hash
+
+
+def get_link_replacements(placeholders=()):
+    """Return the encoded and raw form of every link placeholder.
+
+    Besides the placeholders restored by default, the given names, such
+    as tag or category, are restored as well.
+    """
+    if isinstance(placeholders, str) or not all(
+        isinstance(name, str) and re.fullmatch(r"\w+", name)
+        for name in placeholders
+    ):
+        raise ValueError(
+            "PANDOC_LINK_PLACEHOLDERS setting must be a list of names."
+        )
+
+    placeholders = tuple(placeholders)
+    replacements = _LINK_REPLACEMENTS.get(placeholders)
+    if replacements is None:
+        links_map = dict(ENCODED_LINKS_TO_RAW_LINKS_MAP)
+        for name in placeholders:
+            links_map["%7B{}%7D".format(name)] = "{{{}}}".format(name)
+        replacements = tuple(links_map.items())
+        _LINK_REPLACEMENTS[placeholders] = replacements
+    return replacements
+
+
+def get_render_cache(settings):
+    """Return the render cache configured in settings or None."""
+    cache_path = settings.get("PANDOC_CACHE_PATH")
+    if not cache_path:
+        return None
+
+    cache_path = os.path.abspath(cache_path)
+    max_size = settings.get("PANDOC_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+    with _RENDER_CACHES_LOCK:
+        cache = _RENDER_CACHES.get(cache_path)
+        if cache is None or cache.max_size != max_size:
+            try:
+                cache = RenderCache(cache_path, max_size)
+            except OSError as error:
+                logger.warning(
+                    "Could not create pandoc cache at %s: %s",
+                    cache_path,
+                    error,
+                )
+                return None
+            _RENDER_CACHES[cache_path] = cache
+    return cache
+
+
+def get_bibliography_directory(settings):
+    """Return the directory holding the pruned bibliographies.
+
+    The bibliographies are kept next to the render cache so that their
+    paths stay the same between builds, otherwise a temporary directory
+    is used until the build is finished.
+    """
+    global _BIBLIOGRAPHY_DIRECTORY  # pylint: disable=global-statement
+    cache_path = settings.get("PANDOC_CACHE_PATH")
+    if cache_path:
+        directory = os.path.join(
+            os.path.abspath(cache_path), BIBLIOGRAPHIES_DIRECTORY
+        )
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    with _BIBLIOGRAPHY_DIRECTORY_LOCK:
+        if _BIBLIOGRAPHY_DIRECTORY is None:
+            _BIBLIOGRAPHY_DIRECTORY = tempfile.mkdtemp(prefix="pandoc-reader-")
+        return _BIBLIOGRAPHY_DIRECTORY
+
+
+def write_bibliography(settings, references, csl_json=False):
+    """Write the references to a bibliography and return its path.
+
+    The references are written as CSL JSON or as CSL YAML. The file is
+    named after its contents, so documents citing the same references
+    share a file and an existing file is never rewritten. Bibliographies
+    kept next to the render cache count towards its size and are evicted
+    along with its entries, so every use marks them as recently used.
+    """
+    if csl_json:
+        extension = "json"
+        data = json.dumps(references, ensure_ascii=False, sort_keys=True)
+    else:
+        extension = "yaml"
+        data = safe_dump({"references": references}, allow_unicode=True)
+    data = data.encode("utf-8")
+    directory = get_bibliography_directory(settings)
+    path = os.path.join(
+        directory,
+        "{}.{}".format(hashlib.sha256(data).hexdigest(), extension),
+    )
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    else:
+        return path
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file_handle:
+            file_handle.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    cache = get_render_cache(settings)
+    if cache is not None:
+        cache.add_file(len(data), path)
+    return path
+
+
+def remove_bibliography_directory(pelican):
+    """Remove the temporary directory of pruned bibliographies."""
+    global _BIBLIOGRAPHY_DIRECTORY  # pylint: disable=global-statement
+    with _BIBLIOGRAPHY_DIRECTORY_LOCK:
+        if _BIBLIOGRAPHY_DIRECTORY is not None:
+            shutil.rmtree(_BIBLIOGRAPHY_DIRECTORY, ignore_errors=True)
+            _BIBLIOGRAPHY_DIRECTORY = None
+
+
+def get_build_manifest(settings):
+    """Return the build manifest kept with the render cache."""
+    cache_path = os.path.abspath(settings.get("PANDOC_CACHE_PATH"))
+    with _BUILD_MANIFESTS_LOCK:
+        manifest = _BUILD_MANIFESTS.get(cache_path)
+        if manifest is None:
+            manifest = BuildManifest(os.path.join(cache_path, MANIFEST_FILE))
+            _BUILD_MANIFESTS[cache_path] = manifest
+    return manifest
+
+
+def get_field_memo(settings):
+    """Return the formatted field memo of the settings or None if disabled.
+
+    The memo is kept with the render cache if one is configured.
+    """
+    max_size = settings.get("PANDOC_FIELD_MEMO_SIZE", 0)
+    if not max_size:
+        return None
+
+    path = None
+    cache_path = settings.get("PANDOC_CACHE_PATH")
+    if cache_path and get_render_cache(settings) is not None:
+        path = os.path.join(os.path.abspath(cache_path), FIELD_MEMO_FILE)
+    with _FIELD_MEMOS_LOCK:
+        memo = _FIELD_MEMOS.get(path)
+        if memo is None or memo.max_size != max_size:
+            memo = FieldMemo(max_size, path)
+            _FIELD_MEMOS[path] = memo
+    return memo
+
+
+def save_field_memos(pelican):
+    """Log the use of field memos and write them after a build."""
+    with _FIELD_MEMOS_LOCK:
+        memos = list(_FIELD_MEMOS.values())
+    for memo in memos:
+        stats = memo.stats()
+        logger.debug(
+            "Formatted field memo: %d hits, %d misses, %d entries.",
+            stats["hits"],
+            stats["misses"],
+            stats["entries"],
+        )
+        memo.save()
+
+
+def get_watch_cache(settings):
+    """Return the in-memory cache kept while watching or None if disabled."""
+    if not settings.get("PANDOC_WATCH", False):
+        return None
+    return _WATCH_CACHE
+
+
+def prune_watch_cache(pelican):
+    """Forget deleted files once Pelican has finished a build."""
+    if get_watch_cache(pelican.settings) is not None:
+        _WATCH_CACHE.prune()
+
+
+def save_build_manifests(pelican):
+    """Write the build manifests once Pelican has finished a build."""
+    with _BUILD_MANIFESTS_LOCK:
+        manifests = list(_BUILD_MANIFESTS.values())
+    for manifest in manifests:
+        manifest.save()
+
+
+def get_pandoc_path(settings):
+    """Return the path of the pandoc executable or None if not found.
+
+    The executable given by the PANDOC_PATH setting, or the one found on
+    the PATH, is only looked up once per process.
+    """
+    executable = settings.get("PANDOC_PATH") or "pandoc"
+    pandoc_path = _PANDOC_PATHS.get(executable)
+    if pandoc_path is None:
+        pandoc_path = shutil.which(executable)
+        if pandoc_path is not None:
+            _PANDOC_PATHS[executable] = pandoc_path
+    return pandoc_path
+
+
+def get_pandoc_version(pandoc_path="pandoc"):
+    """Return the version of pandoc as a tuple of integers."""
+    version = _PANDOC_VERSIONS.get(pandoc_path)
+    if version is None:
+        output = subprocess.run(
+            [pandoc_path, "--version"],
+            capture_output=True,
+            encoding="utf-8",
+            check=True,
+        )
+        match = re.search(r"\d+(\.\d+)*", output.stdout.splitlines()[0])
+        version = tuple(int(part) for part in match.group(0).split("."))
+        _PANDOC_VERSIONS[pandoc_path] = version
+    return version
+
+
+def get_pandoc_api_version(pandoc_path="pandoc"):
+    """Return the version of the JSON AST pandoc reads and writes."""
+    api_version = _PANDOC_API_VERSIONS.get(pandoc_path)
+    if api_version is None:
+        output = subprocess.run(
+            [pandoc_path, "--from", "markdown", "--to", "json"],
+            input="",
+            capture_output=True,
+            encoding="utf-8",
+            check=True,
+        )
+        api_version = json.loads(output.stdout)["pandoc-api-version"]
+        _PANDOC_API_VERSIONS[pandoc_path] = api_version
+    return api_version
+
+
+class UnsupportedServerOption(Exception):
+    """Raised for pandoc options that the pandoc server cannot handle."""
+
+
+class PandocServer:
+    """Client for a long running pandoc server.
+
+    Pandoc commands are translated into the JSON parameters understood by
+    ``pandoc-server``, which are the same as those of a defaults file.
+    Every thread keeps its own connection open between conversions. The
+    convert method returns None whenever the server cannot be used, in
+    which case the caller is expected to run pandoc as a subprocess.
+    """
+
+    # Options taking a value mapped to their defaults file keys
+    VALUE_OPTIONS = {
+        "-f": "from",
+        "-r": "from",
+        "--from": "from",
+        "--read": "from",
+        "-t": "to",
+        "-w": "to",
+        "--to": "to",
+        "--write": "to",
+        "--toc-depth": "toc-depth",
+        "--id-prefix": "identifier-prefix",
+        "--wrap": "wrap",
+        "--columns": "columns",
+        "--shift-heading-level-by": "shift-heading-level-by",
+        "--email-obfuscation": "email-obfuscation",
+        "--tab-stop": "tab-stop",
+        "--highlight-style": "highlight-style",
+        "--reference-location": "reference-location",
+        "--top-level-division": "top-level-division",
+        "--template": "template",
+        "--bibliography": "bibliography",
+        "--csl": "csl",
+        "-V": "variables",
+        "--variable": "variables",
+        "-M": "metadata",
+        "--metadata": "metadata",
+        "--defaults": "defaults",
+        "-d": "defaults",
+    }
+
+    # Options without a value mapped to their defaults file keys
+    FLAG_OPTIONS = {
+        "-s": "standalone",
+        "--standalone": "standalone",
+        "--toc": "table-of-contents",
+        "--table-of-contents": "table-of-contents",
+        "-N": "number-sections",
+        "--number-sections": "number-sections",
+        "--section-divs": "section-divs",
+        "--html-q-tags": "html-q-tags",
+        "--ascii": "ascii",
+        "--strip-comments": "strip-comments",
+        "-C": "citeproc",
+        "--citeproc": "citeproc",
+    }
+
+    MATH_OPTIONS = (
+        "--mathjax",
+        "--katex",
+        "--mathml",
+        "--webtex",
+        "--gladtex",
+    )
+
+    INTEGER_KEYS = (
+        "toc-depth",
+        "columns",
+        "shift-heading-level-by",
+        "tab-stop",
+    )
+
+    # Defaults file keys that are passed on to the server unchanged
+    DEFAULTS_KEYS = (
+        "from",
+        "to",
+        "standalone",
+        "table-of-contents",
+        "toc-depth",
+        "number-sections",
+        "section-divs",
+        "identifier-prefix",
+        "html-math-method",
+        "html-q-tags",
+        "ascii",
+        "wrap",
+        "columns",
+        "shift-heading-level-by",
+        "email-obfuscation",
+        "tab-stop",
+        "highlight-style",
+        "reference-location",
+        "top-level-division",
+        "strip-comments",
+        "citeproc",
+        "cite-method",
+        "metadata",
+        "variables",
+    )
+
+    def __init__(self, url, timeout=SERVER_TIMEOUT):
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme != "http":
+            raise ValueError("PANDOC_SERVER_URL must be an http:// URL.")
+        self.url = url
+        self.timeout = timeout
+        self._host = parsed_url.hostname
+        self._port = parsed_url.port
+        self._path = parsed_url.path or "/"
+        self._local = threading.local()
+        self._retry_time = 0
+
+    def convert(self, pandoc_cmd, content):
+        """Convert content on the server and return the output or None."""
+        if time.monotonic() < self._retry_time:
+            return None
+
+        try:
+            params = self._create_params(pandoc_cmd)
+        except UnsupportedServerOption as unsupported:
+            logger.debug("Not using pandoc server: %s", unsupported)
+            return None
+        params["text"] = content
+        body = json.dumps(params).encode("utf-8")
+
+        # A kept alive connection may have been closed by the server in the
+        # meantime so give it a second chance with a new connection
+        for _ in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request(
+                    "POST",
+                    self._path,
+                    body=body,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Accept": "application/json",
+                    },
+                )
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                self._close_connection()
+                continue
+
+            if response.status != 200:
+                # Let the subprocess report conversion errors as usual
+                return None
+            result = json.loads(data.decode("utf-8"))
+            if result.get("base64"):
+                return None
+            output = result["output"]
+            if not params.get("standalone") and not output.endswith("\n"):
+                # Pandoc terminates output written to stdout with a newline
+                output += "\n"
+            return output
+
+        logger.warning(
+            "Could not connect to pandoc server at %s,"
+            " falling back to running pandoc as a subprocess.",
+            self.url,
+        )
+        self._retry_time = time.monotonic() + SERVER_RETRY_INTERVAL
+        return None
+
+    def _get_connection(self):
+        """Return the connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(
+                self._host, self._port, timeout=self.timeout
+            )
+            self._local.connection = connection
+        return connection
+
+    def _close_connection(self):
+        """Close the connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _create_params(self, pandoc_cmd):
+        """Translate a pandoc command into pandoc server parameters."""
+        params = {}
+        files = {}
+        arguments = iter(pandoc_cmd[1:])
+        for argument in arguments:
+            option, has_value, value = argument.partition("=")
+            if option in self.MATH_OPTIONS:
+                params["html-math-method"] = {"method": option[2:]}
+                if has_value:
+                    params["html-math-method"]["url"] = value
+            elif option in self.FLAG_OPTIONS and not has_value:
+                params[self.FLAG_OPTIONS[option]] = True
+            elif option in self.VALUE_OPTIONS:
+                if not has_value:
+                    value = next(arguments, None)
+                    if value is None:
+                        raise UnsupportedServerOption(argument)
+                try:
+                    self._add_param(
+                        params, files, self.VALUE_OPTIONS[option], value
+                    )
+                except (OSError, ValueError, YAMLError) as error:
+                    # Leave reporting unreadable files or invalid values
+                    # to the pandoc subprocess
+                    raise UnsupportedServerOption(argument) from error
+            else:
+                raise UnsupportedServerOption(argument)
+
+        if files:
+            params["files"] = files
+        return params
+
+    def _add_param(self, params, files, key, value):
+        """Add the value of a command line option to the parameters."""
+        if key == "defaults":
+            self._add_defaults(params, files, value)
+        elif key == "template":
+            with open(value, encoding="utf-8") as file_handle:
+                params["template"] = file_handle.read()
+        elif key == "bibliography":
+            params.setdefault("bibliography", []).append(value)
+            self._add_file(files, value)
+        elif key == "csl":
+            params["csl"] = value
+            self._add_file(files, value)
+        elif key in ("variables", "metadata"):
+            # Pandoc splits at whichever of = or : comes first
+            separators = [value.find(sep) for sep in "=:" if sep in value]
+            if separators:
+                index = min(separators)
+                name, variable = value[:index], value[index + 1 :]
+            else:
+                name, variable = value, ""
+            params.setdefault(key, {})[name] = variable or True
+        elif key in self.INTEGER_KEYS:
+            params[key] = int(value)
+        else:
+            params[key] = value
+
+    def _add_defaults(self, params, files, default_file):
+        """Add the settings of a pandoc defaults file to the parameters."""
+        with open(default_file) as file_handle:
+            defaults = safe_load(file_handle) or {}
+
+        for key, value in defaults.items():
+            key = {"reader": "from", "writer": "to"}.get(key, key)
+            if key == "bibliography":
+                for bib_file in value if isinstance(value, list) else [value]:
+                    self._add_param(params, files, key, bib_file)
+            elif key == "csl":
+                self._add_param(params, files, key, value)
+            elif key in self.DEFAULTS_KEYS:
+                params[key] = value
+            else:
+                raise UnsupportedServerOption(key)
+
+    @staticmethod
+    def _add_file(files, path):
+        """Make a local file available to the server."""
+        if "://" in path:
+            raise UnsupportedServerOption(path)
+        with open(path, "rb") as file_handle:
+            files[path] = base64.b64encode(file_handle.read()).decode("ascii")
+
+
+_ASYNC_SEMAPHORES = weakref.WeakKeyDictionary()
+_ASYNC_SEMAPHORES_LOCK = threading.Lock()
+_PANDOC_SERVERS = {}
+_PANDOC_SERVERS_LOCK = threading.Lock()
+
+
+def get_async_semaphore(settings):
+    """Return the semaphore bounding the pandoc runs of the event loop.
+
+    Semaphores belong to the event loop they are used in, so every loop
+    has its own, bounding the conversions of all readers using it.
+    """
+    limit = settings.get("PANDOC_ASYNC_PROCESSES", os.cpu_count() or 1)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError(
+            "PANDOC_ASYNC_PROCESSES setting must be a positive integer."
+        )
+
+    loop = asyncio.get_event_loop()
+    with _ASYNC_SEMAPHORES_LOCK:
+        semaphores = _ASYNC_SEMAPHORES.setdefault(loop, {})
+        semaphore = semaphores.get(limit)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit)
+            semaphores[limit] = semaphore
+    return semaphore
+
+
+def get_pandoc_server(settings):
+    """Return the client for the pandoc server configured in settings."""
+    url = settings.get("PANDOC_SERVER_URL", DEFAULT_SERVER_URL)
+    with _PANDOC_SERVERS_LOCK:
+        server = _PANDOC_SERVERS.get(url)
+        if server is None:
+            server = PandocServer(url)
+            _PANDOC_SERVERS[url] = server
+    return server
+
+
+class BibliographyIndex:
+    """Index of the bibliography files found below a directory.
+
+    The directory tree is walked once and every bibliography is recorded
+    under its file name, so finding the bibliographies of a document does
+    not require walking its directory again. The modification times of
+    all directories are kept to tell if the index has to be rebuilt.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._paths = {}
+        self._signatures = {}
+        self._lock = threading.Lock()
+        self._build()
+
+    def find(self, source_path):
+        """Return the bibliographies for a file in walk order.
+
+        Bibliographies share the name of the file and are located in its
+        directory or in any of the subdirectories.
+        """
+        filename = os.path.splitext(os.path.basename(source_path))[0]
+        directory_path = os.path.dirname(os.path.abspath(source_path))
+        prefix = os.path.join(directory_path, "")
+
+        matches = []
+        with self._lock:
+            for extension_index, extension in enumerate(VALID_BIB_EXTENSIONS):
+                bib_name = ".".join([filename, extension])
+                for position, root in self._paths.get(bib_name, []):
+                    if root == directory_path or root.startswith(prefix):
+                        matches.append(
+                            (
+                                position,
+                                extension_index,
+                                os.path.join(root, bib_name),
+                            )
+                        )
+        return [bib_file for _, _, bib_file in sorted(matches)]
+
+    def refresh(self):
+        """Rebuild the index if any directory changed since it was built."""
+        with self._lock:
+            signatures = self._signatures
+        for directory_path, signature in signatures.items():
+            if get_file_signature(directory_path) != signature:
+                self._build()
+                return
+
+    def _build(self):
+        """Walk the directory tree and record every bibliography."""
+        paths = {}
+        signatures = {}
+        extensions = tuple(
+            "." + extension for extension in VALID_BIB_EXTENSIONS
+        )
+        for position, (root, _, files) in enumerate(os.walk(self.root)):
+            signatures[root] = get_file_signature(root)
+            for name in files:
+                if name.endswith(extensions):
+                    paths.setdefault(name, []).append((position, root))
+
+        with self._lock:
+            self._paths = paths
+            self._signatures = signatures
+
+
+_BIBLIOGRAPHY_INDEXES = {}
+_BIBLIOGRAPHY_INDEXES_LOCK = threading.Lock()
+
+
+def get_bibliography_index(settings, source_path):
+    """Return the bibliography index covering the given file.
+
+    Files in the content path share a single index, any other file gets
+    an index of its own directory.
+    """
+    content_path = os.path.abspath(settings.get("PATH", os.curdir))
+    directory_path = os.path.dirname(os.path.abspath(source_path))
+    root = directory_path
+    if directory_path == content_path or directory_path.startswith(
+        os.path.join(content_path, "")
+    ):
+        root = content_path
+
+    with _BIBLIOGRAPHY_INDEXES_LOCK:
+        index = _BIBLIOGRAPHY_INDEXES.get(root)
+        if index is None:
+            index = BibliographyIndex(root)
+            _BIBLIOGRAPHY_INDEXES[root] = index
+    return index
+
+
+def refresh_bibliography_indexes(readers):
+    """Bring the bibliography indexes up to date for a new build."""
+    with _BIBLIOGRAPHY_INDEXES_LOCK:
+        indexes = list(_BIBLIOGRAPHY_INDEXES.values())
+    for index in indexes:
+        index.refresh()
+
+
+class PrerenderPool:
+    """Render Pandoc Markdown files before Pelican asks for them.
+
+    Files are rendered by a bounded pool of worker threads, each of which
+    spends most of its time waiting on a pandoc process. With a batch size
+    above one, files submitted together are rendered in batches sharing
+    their pandoc runs. Results, including any exception raised while
+    rendering, are handed out once by collect. With PANDOC_COMPRESS_OUTPUT
+    enabled, the results waiting to be collected are kept compressed.
+    """
+
+    def __init__(self, settings, workers, batch_size=DEFAULT_BATCH_SIZE):
+        self.settings = settings
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, *source_paths):
+        """Schedule files for rendering unless they are already scheduled."""
+        scheduled = {}
+        with self._lock:
+            for source_path in source_paths:
+                source_path = os.path.abspath(source_path)
+                signature = get_file_signature(source_path)
+                pending = self._pending.get(source_path)
+                if pending is not None and pending[0] == signature:
+                    continue
+                if self.batch_size > 1:
+                    future = Future()
+                    scheduled[source_path] = future
+                else:
+                    future = self._executor.submit(self._render, source_path)
+                self._pending[source_path] = (signature, future)
+
+            for batch in plan_batches(list(scheduled), self.batch_size):
+                self._executor.submit(
+                    self._render_batch,
+                    {
+                        source_path: scheduled[source_path]
+                        for source_path in batch
+                    },
+                )
+
+    def collect(self, source_path):
+        """Return the rendering of a file or None if it was not scheduled.
+
+        Renderings of files that changed after they were scheduled are
+        discarded so that stale output is never returned.
+        """
+        source_path = os.path.abspath(source_path)
+        with self._lock:
+            pending = self._pending.pop(source_path, None)
+        if pending is None:
+            return None
+
+        signature, future = pending
+        if signature != get_file_signature(source_path):
+            future.cancel()
+            return None
+        return future.result()
+
+    def wait(self):
+        """Block until every scheduled file has been rendered."""
+        with self._lock:
+            futures = [future for _, future in self._pending.values()]
+        wait(futures)
+
+    def shutdown(self):
+        """Discard pending work and stop the worker threads."""
+        with self._lock:
+            for _, future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+    def _render(self, source_path):
+        """Render a single file in a worker thread."""
+        with profile_document(self.settings, source_path):
+            pandoc_reader = PandocReader(self.settings)
+            signature = get_file_signature(source_path)
+            content = pandoc_reader._read_source(source_path)
+            return pandoc_reader._render_source(
+                source_path, content, signature
+            )
+
+    def _render_batch(self, futures):
+        """Render several files in a worker thread, sharing pandoc runs.
+
+        Futures maps every file to the future receiving its result, files
+        whose futures were cancelled in the meantime are skipped.
+        """
+        futures = {
+            source_path: future
+            for source_path, future in futures.items()
+            if future.set_running_or_notify_cancel()
+        }
+        try:
+            pandoc_reader = PandocReader(self.settings)
+            steps = {}
+            for source_path, future in futures.items():
+                try:
+                    with profile_document(self.settings, source_path):
+                        signature = get_file_signature(source_path)
+                        content = pandoc_reader._read_source(source_path)
+                except Exception as error:  # pylint: disable=broad-except
+                    future.set_exception(error)
+                    continue
+                steps[source_path] = pandoc_reader._render_source_steps(
+                    source_path, content, signature
+                )
+
+            results = pandoc_reader._run_batch_steps(steps)
+            for source_path, result in results.items():
+                if isinstance(result, Exception):
+                    futures[source_path].set_exception(result)
+                else:
+                    futures[source_path].set_result(result)
+        except Exception as error:  # pylint: disable=broad-except
+            # Never leave a file waiting for a result that will not come
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(error)
+
+
+_PRERENDER_POOL = None
+_PRERENDER_POOL_LOCK = threading.Lock()
+_BUILD_PROFILE = None
+_BUILD_PROFILE_LOCK = threading.Lock()
+_PROFILED_FILE = contextvars.ContextVar(
+    "pandoc_reader_profiled_file", default=None
+)
+
+
+def plan_batches(source_paths, batch_size, max_bytes=MAX_BATCH_BYTES):
+    """Split files into batches of at most batch_size files.
+
+    A batch is also closed once its files add up to max_bytes, so that
+    large files are rendered on their own instead of holding up the small
+    files batched with them.
+    """
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for source_path in source_paths:
+        signature = get_file_signature(source_path)
+        size = signature[1] if signature is not None else 0
+        if batch and (
+            len(batch) >= batch_size or batch_bytes + size > max_bytes
+        ):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(source_path)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_prerender_pool(settings):
+    """Return the pre-render pool serving the given settings or None."""
+    prerender_pool = _PRERENDER_POOL
+    if prerender_pool is None or prerender_pool.settings is not settings:
+        return None
+    return prerender_pool
+
+
+class BuildProfile:
+    """Record of where the time of reading files goes during a build.
+
+    For every file the time spent in each phase of reading it is added up,
+    along with every pandoc run, its label and the sizes of its input and
+    output in characters. Phases may contain each other, pandoc runs made
+    while pre-parsing bibliographies count towards both phases for example.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, source_path, phase, seconds):
+        """Add the time spent in a phase of reading a file."""
+        with self._lock:
+            phases = self._get_file(source_path)["phases"]
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def add_pandoc_run(self, source_path, label, seconds, input_size, size):
+        """Add a pandoc run made while reading a file."""
+        run = {
+            "label": label,
+            "seconds": seconds,
+            "input_size": input_size,
+            "output_size": size,
+        }
+        with self._lock:
+            profiled_file = self._get_file(source_path)
+            profiled_file["pandoc_runs"].append(run)
+            phases = profiled_file["phases"]
+            phases["pandoc"] = phases.get("pandoc", 0.0) + seconds
+
+    def summarize(self, top=DEFAULT_PROFILE_TOP):
+        """Return the profile of every file along with build totals."""
+        with self._lock:
+            files = {
+                source_path: {
+                    "phases": dict(profiled_file["phases"]),
+                    "pandoc_runs": list(profiled_file["pandoc_runs"]),
+                }
+                for source_path, profiled_file in self._files.items()
+            }
+
+        phases = {}
+        runs = []
+        for profiled_file in files.values():
+            for phase, seconds in profiled_file["phases"].items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+            runs.extend(profiled_file["pandoc_runs"])
+        slowest = sorted(
+            files,
+            key=lambda path: files[path]["phases"].get("total", 0.0),
+            reverse=True,
+        )[:top]
+        return {
+            "files": files,
+            "slowest": [
+                {
+                    "path": source_path,
+                    "seconds": files[source_path]["phases"].get("total", 0.0),
+                }
+                for source_path in slowest
+            ],
+            "totals": {
+                "files": len(files),
+                "phases": phases,
+                "pandoc_runs": len(runs),
+                "input_size": sum(run["input_size"] for run in runs),
+                "output_size": sum(run["output_size"] for run in runs),
+            },
+        }
+
+    def _get_file(self, source_path):
+        """Return the record of a file, creating it if needed."""
+        profiled_file = self._files.get(source_path)
+        if profiled_file is None:
+            profiled_file = {"phases": {}, "pandoc_runs": []}
+            self._files[source_path] = profiled_file
+        return profiled_file
+
+
+def get_build_profile(settings):
+    """Return the profile of the current build or None if not profiling."""
+    global _BUILD_PROFILE  # pylint: disable=global-statement
+    if not settings.get("PANDOC_PROFILE", False):
+        return None
+    with _BUILD_PROFILE_LOCK:
+        if _BUILD_PROFILE is None:
+            _BUILD_PROFILE = BuildProfile()
+        return _BUILD_PROFILE
+
+
+@contextlib.contextmanager
+def profile_document(settings, source_path):
+    """Profile the reading of a file if PANDOC_PROFILE is enabled.
+
+    Phases and pandoc runs profiled within are recorded for the file,
+    the time spent within altogether is recorded as its total.
+    """
+    profile = get_build_profile(settings)
+    if profile is None or _PROFILED_FILE.get() is not None:
+        yield
+        return
+
+    source_path = os.path.abspath(source_path)
+    token = _PROFILED_FILE.set((profile, source_path))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _PROFILED_FILE.reset(token)
+        profile.add_phase(source_path, "total", time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def profile_phase(phase):
+    """Record the time spent within for the file being profiled."""
+    profiled_file = _PROFILED_FILE.get()
+    if profiled_file is None:
+        yield
+        return
+
+    profile, source_path = profiled_file
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(source_path, phase, time.perf_counter() - start)
+
+
+def profile_pandoc_run(label, start, content, output):
+    """Record a pandoc run started at start for the file being profiled."""
+    profiled_file = _PROFILED_FILE.get()
+    if profiled_file is not None:
+        profile, source_path = profiled_file
+        profile.add_pandoc_run(
+            source_path,
+            label,
+            time.perf_counter() - start,
+            len(content),
+            len(output),
+        )
+
+
+def report_build_profile(pelican):
+    """Log the profile of a finished build and write it out if requested."""
+    global _BUILD_PROFILE  # pylint: disable=global-statement
+    with _BUILD_PROFILE_LOCK:
+        profile, _BUILD_PROFILE = _BUILD_PROFILE, None
+    if profile is None:
+        return
+
+    settings = pelican.settings
+    summary = profile.summarize(
+        settings.get("PANDOC_PROFILE_TOP", DEFAULT_PROFILE_TOP)
+    )
+    totals = summary["totals"]
+    lines = [
+        "Pandoc reader read {} files with {} pandoc runs,"
+        " converting {} characters into {}.".format(
+            totals["files"],
+            totals["pandoc_runs"],
+            totals["input_size"],
+            totals["output_size"],
+        ),
+        "Time spent per phase:",
+    ]
+    for phase, seconds in sorted(
+        totals["phases"].items(), key=lambda item: item[1], reverse=True
+    ):
+        lines.append("  {:<14} {:10.3f} s".format(phase, seconds))
+    lines.append("Slowest files:")
+    for slow_file in summary["slowest"]:
+        lines.append(
+            "  {:10.3f} s  {}".format(slow_file["seconds"], slow_file["path"])
+        )
+    logger.info("\n".join(lines))
+
+    profile_path = settings.get("PANDOC_PROFILE_PATH")
+    if profile_path:
+        try:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(profile_path)), exist_ok=True
+            )
+            with open(profile_path, "w", encoding="utf-8") as file_handle:
+                json.dump(summary, file_handle, indent=2)
+        except OSError as error:
+            logger.warning(
+                "Could not write pandoc reader profile to %s: %s",
+                profile_path,
+                error,
+            )
+
+
+def find_source_files(settings):
+    """Find all Pandoc Markdown files in the article and page paths."""
+    content_path = settings.get("PATH", os.curdir)
+    ignores = settings.get("IGNORE_FILES", [])
+    excludes = {
+        os.path.normpath(os.path.join(content_path, exclude))
+        for exclude in settings.get("ARTICLE_EXCLUDES", [])
+        + settings.get("PAGE_EXCLUDES", [])
+    }
+
+    source_files = {}
+    for path in settings.get("ARTICLE_PATHS", [""]) + settings.get(
+        "PAGE_PATHS", []
+    ):
+        root = os.path.join(content_path, path) if path else content_path
+        for dirpath, dirs, files in os.walk(root, followlinks=True):
+            dirs[:] = [
+                directory
+                for directory in dirs
+                if os.path.normpath(os.path.join(dirpath, directory))
+                not in excludes
+                and not any(
+                    fnmatch.fnmatch(directory, ignore) for ignore in ignores
+                )
+            ]
+            for filename in files:
+                extension = os.path.splitext(filename)[1][1:]
+                if extension not in FILE_EXTENSIONS or any(
+                    fnmatch.fnmatch(filename, ignore) for ignore in ignores
+                ):
+                    continue
+                source_path = os.path.abspath(os.path.join(dirpath, filename))
+                source_files[source_path] = None
+    return list(source_files)
+
+
+def start_prerendering(readers):
+    """Start rendering all Pandoc Markdown files in the background."""
+    global _PRERENDER_POOL  # pylint: disable=global-statement
+    settings = readers.settings
+    workers = settings.get("PANDOC_WORKERS", 0)
+    if (
+        isinstance(workers, bool)
+        or not isinstance(workers, int)
+        or workers < 0
+    ):
+        raise ValueError(
+            "PANDOC_WORKERS setting must be a non-negative integer."
+        )
+    if not workers:
+        return
+
+    batch_size = settings.get("PANDOC_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    if (
+        isinstance(batch_size, bool)
+        or not isinstance(batch_size, int)
+        or batch_size < 1
+    ):
+        raise ValueError(
+            "PANDOC_BATCH_SIZE setting must be a positive integer."
+        )
+
+    # Files Pelican loads from its own content cache are never read, so
+    # rendering them in the background would only duplicate work
+    if settings.get("LOAD_CONTENT_CACHE", False):
+        logger.debug(
+            "Not rendering files in the background as Pelican's content"
+            " cache is enabled."
+        )
+        return
+
+    with _PRERENDER_POOL_LOCK:
+        if _PRERENDER_POOL is None or _PRERENDER_POOL.settings is not settings:
+            if _PRERENDER_POOL is not None:
+                _PRERENDER_POOL.shutdown()
+            _PRERENDER_POOL = PrerenderPool(settings, workers, batch_size)
+        prerender_pool = _PRERENDER_POOL
+
+    # Files rendered from unchanged inputs are served from the render cache
+    pandoc_reader = PandocReader(settings)
+    prerender_pool.submit(
+        *(
+            source_path
+            for source_path in find_source_files(settings)
+            if not pandoc_reader._is_rendered(source_path)
+        )
+    )
+
+
+def stop_prerendering(pelican):
+    """Stop the pre-render pool once Pelican has finished a build."""
+    global _PRERENDER_POOL  # pylint: disable=global-statement
+    with _PRERENDER_POOL_LOCK:
+        if _PRERENDER_POOL is not None:
+            _PRERENDER_POOL.shutdown()
+            _PRERENDER_POOL = None
+
+
 def add_reader(readers):
     """Add the PandocReader as the reader for all Pandoc Markdown files."""
     for ext in PandocReader.file_extensions:
@@ -366,3 +3493,11 @@ def add_reader(readers):
 def register():
     """Register the PandocReader."""
     signals.readers_init.connect(add_reader)
+    signals.readers_init.connect(refresh_bibliography_indexes)
+    signals.readers_init.connect(start_prerendering)
+    signals.finalized.connect(stop_prerendering)
+    signals.finalized.connect(remove_bibliography_directory)
+    signals.finalized.connect(save_build_manifests)
+    signals.finalized.connect(save_field_memos)
+    signals.finalized.connect(prune_watch_cache)
+    signals.finalized.connect(report_build_profile)
@@ -1,12 +1,50 @@
 """Tests for pandoc-reader plugin."""
 # pylint: disable=too-many-lines
+import asyncio
+import http.server
+import json
 import os
+import pickle
+import re
 import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from unittest import mock
+
+import yaml
 
 from pelican.tests.support import get_settings
 
-from pandoc_reader import PandocReader
+from pandoc_reader import (
+    BibliographyIndex,
+    BuildManifest,
+    FieldMemo,
+    PandocReader,
+    PandocServer,
+    PrerenderPool,
+    RenderCache,
+    RenderedDocument,
+    count_words,
+    get_field_memo,
+    get_pandoc_version,
+    get_prerender_pool,
+    get_render_cache,
+    plan_batches,
+    prune_watch_cache,
+    read_front_matter,
+    remove_bibliography_directory,
+    report_build_profile,
+    save_build_manifests,
+    save_field_memos,
+    scan_front_matter,
+    start_prerendering,
+    stop_prerendering,
+    write_bibliography,
+)
 
 DIR_PATH = os.path.dirname(__file__)
 TEST_CONTENT_PATH = os.path.abspath(os.path.join(DIR_PATH, "test_content"))
@@ -21,6 +59,15 @@ CALCULATE_READING_TIME = True
 FORMATTED_FIELDS = ["summary"]
 
 
+def get_header_value(source_path, field):
+    """Return the raw value of a field in the header of a test file."""
+    with open(source_path) as file_handle:
+        for line in file_handle:
+            if line.startswith(field + ":"):
+                return line.split(":", 1)[1].strip().strip('"')
+    return None
+
+
 class TestGeneralTestCases(unittest.TestCase):
     """Test installation of Pandoc."""
 
@@ -101,6 +148,136 @@ class TestGeneralTestCases(unittest.TestCase):
         message = str(context_manager.exception)
         self.assertEqual("READING_SPEED setting must be a number.", message)
 
+    def test_native_word_count_reading_time(self):
+        """Check if the native word counter gives the same reading time."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            READING_SPEED=100,
+            WORD_COUNT_METHOD="native",
+        )
+
+        pandoc_reader = PandocReader(settings)
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "reading_time_content.md"
+        )
+
+        _, metadata = pandoc_reader.read(source_path)
+
+        self.assertEqual("1 minute", str(metadata["reading_time"]))
+
+    def test_native_word_count_skips_non_prose(self):
+        """Check if the native word counter only counts words read."""
+        content = (
+            "---\ntitle: Not counted\n---\n"
+            "Hello *world*, it's a [link](https://example.com/a/b)"
+            " and ![image](image.png).\n\n"
+            "```python\ndef not_counted():\n    pass\n```\n\n"
+            "Math $x + y$ and\n\n$$\na = b\n$$\n\n"
+            '<span class="ignored">counted</span> `not counted`  and\tthis.\n'
+            "<!-- not\ncounted -->\n"
+        )
+        self.assertEqual(11, count_words(content))
+
+    def test_pandoc_word_count_reading_time(self):
+        """Check if pandoc counts words without changing the output."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            READING_SPEED=100,
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "reading_time_content.md"
+        )
+
+        expected_output, _ = PandocReader(settings).read(source_path)
+        settings["WORD_COUNT_METHOD"] = "pandoc"
+        output, metadata = PandocReader(settings).read(source_path)
+
+        self.assertEqual(expected_output, output)
+        self.assertEqual("1 minute", str(metadata["reading_time"]))
+        self.assertEqual(
+            metadata["statistics"],
+            PandocReader(settings).read_metadata(source_path)["statistics"],
+        )
+
+    def test_pandoc_word_count_with_citations(self):
+        """Check if pandoc counts words without the list of references."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS + ["+citations"],
+            PANDOC_ARGS=PANDOC_ARGS + ["--citeproc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "valid_content_with_citation.md"
+        )
+
+        expected_output, _ = PandocReader(settings).read(source_path)
+        settings["WORD_COUNT_METHOD"] = "pandoc"
+        output, metadata = PandocReader(settings).read(source_path)
+
+        self.assertEqual(expected_output, output)
+        self.assertIn('id="refs"', output)
+        statistics = PandocReader(settings).read_metadata(source_path)[
+            "statistics"
+        ]
+        self.assertEqual(metadata["statistics"], statistics)
+
+    def test_pandoc_statistics(self):
+        """Check if pandoc counts words, images, code blocks and headings."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            WORD_COUNT_METHOD="pandoc",
+        )
+        content = (
+            "---\ntitle: Not counted\n---\n"
+            "# A heading\n\n"
+            "Hello *world*, it's a [link](https://example.com/a/b)"
+            " and ![not counted](image.png).\n\n"
+            "```python\ndef not_counted():\n    pass\n```\n\n"
+            "Math $x + y$ and -- this.\n"
+        )
+
+        output, statistics = PandocReader._split_statistics(
+            PandocReader(settings)._convert(
+                ["pandoc", "--from=markdown", "--to=html5"]
+                + PandocReader._get_statistics_args(),
+                content,
+            )
+        )
+
+        self.assertNotIn("pandoc-reader-statistics", output)
+        self.assertEqual(
+            {"words": 11, "images": 1, "code_blocks": 1, "headings": 1},
+            statistics,
+        )
+
+    def test_invalid_word_count_method(self):
+        """Check if exception is raised for an unknown word count method."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            WORD_COUNT_METHOD="wc",
+        )
+
+        pandoc_reader = PandocReader(settings)
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "reading_time_content.md"
+        )
+
+        with self.assertRaises(ValueError) as context_manager:
+            pandoc_reader.read(source_path)
+
+        message = str(context_manager.exception)
+        self.assertEqual(
+            "WORD_COUNT_METHOD setting must be either mwc, native or pandoc.",
+            message,
+        )
+
     def test_summary(self):
         """Check if summary output is valid."""
 
@@ -133,6 +310,170 @@ class TestGeneralTestCases(unittest.TestCase):
             str(metadata["summary"]),
         )
 
+    def test_formatted_fields_share_pandoc_run(self):
+        """Check if formatted fields are converted in a single pandoc run."""
+        formatted_fields = [
+            "summary",
+            "subtitle",
+            "disclaimer",
+            "note",
+            "warning",
+            "tail",
+        ]
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            FORMATTED_FIELDS=formatted_fields,
+        )
+
+        pandoc_reader = PandocReader(settings)
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "formatted_fields_content.md"
+        )
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            _, metadata = pandoc_reader.read(source_path)
+
+        # One run for the content, one for the fields that can be
+        # converted together and one each for the field with a footnote
+        # and the field opening a fenced div
+        self.assertEqual(4, run_pandoc.call_count)
+
+        pandoc_cmd = run_pandoc.call_args_list[0][0][0]
+        for field in formatted_fields:
+            self.assertEqual(
+                PandocReader._run_pandoc(
+                    pandoc_cmd, get_header_value(source_path, field)
+                ),
+                str(metadata[field]),
+            )
+
+    def test_unclosed_blocks_are_not_split(self):
+        """Check if segments swallowing a separator are detected."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS, PANDOC_ARGS=PANDOC_ARGS
+        )
+        pandoc_cmd = PandocReader(settings)._construct_pandoc_command(
+            [], PANDOC_ARGS, "".join(PANDOC_EXTENSIONS)
+        )
+
+        segments = ["Intro text", "Tail *text*"]
+        output = PandocReader._run_pandoc(
+            pandoc_cmd, PandocReader._join_segments(segments)
+        )
+        self.assertEqual(
+            ["<p>Intro text</p>\n", "<p>Tail <em>text</em></p>\n"],
+            PandocReader._split_segments(output, len(segments)),
+        )
+
+        segments = ["Intro text", "::: warning", "Tail *text*"]
+        output = PandocReader._run_pandoc(
+            pandoc_cmd, PandocReader._join_segments(segments)
+        )
+        self.assertIsNone(PandocReader._split_segments(output, len(segments)))
+
+    def test_read_metadata_matches_read(self):
+        """Check if metadata read on its own matches that of a full read."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            FORMATTED_FIELDS=["summary", "subtitle", "note"],
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "formatted_fields_content.md"
+        )
+        _, expected = PandocReader(settings).read(source_path)
+
+        metadata = PandocReader(settings).read_metadata(
+            source_path, formatted_fields=True
+        )
+        self.assertEqual(expected, metadata)
+
+    def test_read_metadata_without_pandoc(self):
+        """Check if formatted fields are left as written unless requested."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            FORMATTED_FIELDS=["summary"],
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "formatted_fields_content.md"
+        )
+        with mock.patch.object(PandocReader, "_run_pandoc") as run_pandoc:
+            metadata = PandocReader(settings).read_metadata(source_path)
+            run_pandoc.assert_not_called()
+
+        self.assertEqual("Formatted Fields Content", str(metadata["title"]))
+        self.assertEqual(
+            "A *short* summary with a [link](https://example.com).",
+            str(metadata["summary"]),
+        )
+        self.assertNotIn("reading_time", metadata)
+
+    def test_lazy_content_is_rendered_once_on_use(self):
+        """Check if lazy content renders once and matches a full read."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            FORMATTED_FIELDS=FORMATTED_FIELDS,
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "valid_content_with_toc.md"
+        )
+        expected_output, expected_metadata = PandocReader(settings).read(
+            source_path
+        )
+
+        with mock.patch.object(
+            PandocReader,
+            "_render_source",
+            autospec=True,
+            side_effect=PandocReader._render_source,
+        ) as render_source:
+            output, metadata = PandocReader(settings).read_lazy(source_path)
+            render_source.assert_not_called()
+
+            threads = [
+                threading.Thread(target=str, args=(output,)) for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(1, render_source.call_count)
+
+            self.assertEqual(expected_output, output)
+            self.assertEqual(expected_metadata["toc"], str(metadata["toc"]))
+            self.assertEqual(1, render_source.call_count)
+
+        del metadata["toc"], expected_metadata["toc"]
+        self.assertEqual(expected_metadata, metadata)
+        self.assertTrue(output.startswith("<p>"))
+        self.assertEqual(expected_output, pickle.loads(pickle.dumps(output)))
+
+    def test_formatted_fields_with_citeproc_are_not_batched(self):
+        """Check if every field gets its own run when citeproc is used."""
+        formatted_fields = ["summary", "subtitle", "disclaimer"]
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--citeproc"],
+            FORMATTED_FIELDS=formatted_fields,
+        )
+
+        pandoc_reader = PandocReader(settings)
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "formatted_fields_content.md"
+        )
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", return_value=""
+        ) as run_pandoc:
+            pandoc_reader.read(source_path)
+
+        self.assertEqual(1 + len(formatted_fields), run_pandoc.call_count)
+
 
 class TestInvalidCasesWithArguments(unittest.TestCase):
     """Invalid test cases using Pandoc arguments and extensions."""
@@ -321,6 +662,35 @@ class TestValidCasesWithArguments(unittest.TestCase):
         self.assertEqual("My Author", str(metadata["author"]))
         self.assertEqual("2020-10-16 00:00:00", str(metadata["date"]))
 
+    def test_registered_link_placeholders(self):
+        """Check if registered link placeholders are restored as well."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_LINK_PLACEHOLDERS=["tag", "category"],
+        )
+        output = PandocReader(settings)._restore_links(
+            '<a href="%7Btag%7Dpython">a</a>'
+            ' <a href="%7Bcategory%7Dnews">b</a>'
+            ' <a href="%7Bstatic%7D/image.png">c</a>'
+            ' <a href="%7Bindex%7D">d</a>'
+        )
+        self.assertEqual(
+            '<a href="{tag}python">a</a>'
+            ' <a href="{category}news">b</a>'
+            ' <a href="{static}/image.png">c</a>'
+            ' <a href="%7Bindex%7D">d</a>',
+            output,
+        )
+
+        for placeholders in ("tag", ["tag|category"], [None]):
+            settings["PANDOC_LINK_PLACEHOLDERS"] = placeholders
+            with self.assertRaisesRegex(
+                ValueError,
+                "PANDOC_LINK_PLACEHOLDERS setting must be a list of names.",
+            ):
+                PandocReader(settings)._restore_links("")
+
     def test_valid_content_with_toc(self):
         """Check if output returned is valid and table of contents is valid."""
         settings = get_settings(
@@ -375,6 +745,32 @@ class TestValidCasesWithArguments(unittest.TestCase):
             str(metadata["toc"]),
         )
 
+    def test_toc_uses_single_pandoc_run(self):
+        """Check if content and table of contents share one pandoc run."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+        )
+
+        pandoc_reader = PandocReader(settings)
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "valid_content_with_toc.md"
+        )
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            output, metadata = pandoc_reader.read(source_path)
+
+        self.assertEqual(1, run_pandoc.call_count)
+        self.assertTrue(output.startswith("<p>This is some valid content"))
+        self.assertNotIn("<nav", output)
+        self.assertNotIn("pandoc-reader-body", output)
+        self.assertTrue(
+            str(metadata["toc"]).startswith('<nav class="toc" role="doc-toc">')
+        )
+        self.assertIn('href="#second-subheading"', str(metadata["toc"]))
+        self.assertTrue(str(metadata["toc"]).endswith("</nav>\n"))
+
     def test_valid_content_with_toc_2(self):
         """Check if output returned is valid and table of contents is valid."""
         settings = get_settings(
@@ -1212,5 +1608,1382 @@ class TestValidCasesWithDefaultFiles(unittest.TestCase):
         )
 
 
+class TestFrontMatter(unittest.TestCase):
+    """Test cases for finding the YAML header of a document."""
+
+    def test_header_and_body_offset(self):
+        """Check if the header lines and the start of the body are found."""
+        for content in (
+            "---\ntitle: Title\ndate: 2020-10-16\n---\nBody\n",
+            "---\r\ntitle: Title\r\ndate: 2020-10-16\r\n...\r\nBody\r\n",
+        ):
+            header_lines, offset = scan_front_matter(content)
+            self.assertEqual(
+                ["title: Title", "date: 2020-10-16"], header_lines
+            )
+            self.assertTrue(content[offset:].startswith("Body"))
+
+    def test_invalid_headers(self):
+        """Check if documents without a valid header raise exceptions."""
+        for content, message in (
+            ("", "Could not find metadata. File is empty."),
+            ("Body\n", "Could not find metadata header '...' or '---'."),
+            ("---\ntitle: Title\n", "Could not find end of metadata block."),
+            ("---\n---\nBody\n", "Could not find end of metadata block."),
+        ):
+            with self.assertRaisesRegex(Exception, re.escape(message)):
+                scan_front_matter(content)
+
+    def test_only_header_is_read_from_disk(self):
+        """Check if reading the header stops at its closing delimiter."""
+        with tempfile.NamedTemporaryFile("wb", suffix=".md") as source_file:
+            source_file.write("---\ntitle: Title\n---\n".encode("utf-8"))
+            source_file.write(b"Body\n" * 100000)
+            # Reading past the header would fail to decode this
+            source_file.write(b"\xff\n")
+            source_file.flush()
+
+            header_lines, offset = read_front_matter(source_file.name)
+
+        self.assertEqual(["title: Title"], header_lines)
+        self.assertEqual(len("---\ntitle: Title\n---\n"), offset)
+
+
+class TestPandocExecutable(unittest.TestCase):
+    """Test cases for locating the pandoc executable."""
+
+    def setUp(self):
+        if not shutil.which("pandoc"):
+            self.skipTest("Pandoc is not installed.")
+        self.bin_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bin_dir.cleanup)
+
+    def test_pandoc_path_setting(self):
+        """Check if PANDOC_PATH is looked up once and used for commands."""
+        pandoc_path = os.path.join(self.bin_dir.name, "my-pandoc")
+        os.symlink(shutil.which("pandoc"), pandoc_path)
+
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_PATH=pandoc_path,
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with mock.patch("shutil.which", wraps=shutil.which) as which:
+            with mock.patch.object(
+                PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+            ) as run_pandoc:
+                PandocReader(settings).read(source_path)
+                PandocReader(settings).read(source_path)
+        self.assertEqual(1, which.call_count)
+        self.assertEqual(pandoc_path, run_pandoc.call_args[0][0][0])
+
+    def test_missing_pandoc_path(self):
+        """Check if a PANDOC_PATH that does not exist raises an exception."""
+        settings = get_settings(
+            PANDOC_PATH=os.path.join(self.bin_dir.name, "missing-pandoc")
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with self.assertRaises(Exception) as context_manager:
+            PandocReader(settings).read(source_path)
+
+        message = str(context_manager.exception)
+        self.assertEqual("Could not find Pandoc. Please install.", message)
+
+    def test_pandoc_version(self):
+        """Check if the pandoc version is probed once and parsed."""
+        pandoc_path = os.path.join(self.bin_dir.name, "pandoc")
+        os.symlink(shutil.which("pandoc"), pandoc_path)
+        with mock.patch(
+            "subprocess.run", wraps=subprocess.run
+        ) as run_subprocess:
+            version = get_pandoc_version(pandoc_path)
+            self.assertEqual(version, get_pandoc_version(pandoc_path))
+        self.assertEqual(1, run_subprocess.call_count)
+        self.assertGreaterEqual(version, (2, 11))
+        self.assertTrue(all(isinstance(part, int) for part in version))
+
+
+class TestPandocConfig(unittest.TestCase):
+    """Test cases for memoizing the validated pandoc configuration."""
+
+    def test_default_files_are_parsed_once(self):
+        """Check if default files are only parsed again after changing."""
+        defaults_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(defaults_dir.cleanup)
+        default_file = os.path.join(defaults_dir.name, "defaults.yaml")
+        shutil.copy(
+            os.path.join(TEST_DEFAULT_FILES_PATH, "valid_defaults.yaml"),
+            default_file,
+        )
+
+        settings = get_settings(PANDOC_DEFAULT_FILES=[default_file])
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with mock.patch.object(
+            PandocReader,
+            "_check_defaults",
+            wraps=PandocReader(settings)._check_defaults,
+        ) as check_defaults:
+            first_result = PandocReader(settings).read(source_path)
+            second_result = PandocReader(settings).read(source_path)
+            self.assertEqual(1, check_defaults.call_count)
+            self.assertEqual(first_result, second_result)
+
+            with open(default_file, "a") as file_handle:
+                file_handle.write("standalone: true\n")
+
+            with self.assertRaises(ValueError) as context_manager:
+                PandocReader(settings).read(source_path)
+            self.assertEqual(2, check_defaults.call_count)
+
+            # Invalid configurations are validated again on every read
+            with self.assertRaises(ValueError):
+                PandocReader(settings).read(source_path)
+            self.assertEqual(3, check_defaults.call_count)
+
+        message = str(context_manager.exception)
+        self.assertEqual(
+            "The default standalone should be set to false.", message
+        )
+
+
+class TestBibliographyIndex(unittest.TestCase):
+    """Test cases for finding bibliographies through an index."""
+
+    def setUp(self):
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.content_dir.cleanup)
+        for path in (
+            "post.bib",
+            "post.json",
+            "sub/post.yaml",
+            "sub/deeper/post.bibtex",
+            "sub/other.bib",
+            "elsewhere/nested/post.bib",
+        ):
+            path = os.path.join(self.content_dir.name, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as file_handle:
+                file_handle.write("")
+
+    @staticmethod
+    def walk_for_bibs(source_path):
+        """Find bibliographies the way the plugin used to."""
+        bib_files = []
+        filename = os.path.splitext(os.path.basename(source_path))[0]
+        directory_path = os.path.dirname(os.path.abspath(source_path))
+        for root, _, files in os.walk(directory_path):
+            for extension in ["json", "yaml", "bibtex", "bib"]:
+                bib_name = ".".join([filename, extension])
+                if bib_name in files:
+                    bib_files.append(os.path.join(root, bib_name))
+        return bib_files
+
+    def test_index_matches_directory_walk(self):
+        """Check if the index finds the same files in the same order."""
+        source_paths = [
+            os.path.join(self.content_dir.name, source_path)
+            for source_path in (
+                "post.md",
+                "sub/post.md",
+                "sub/other.md",
+                "elsewhere/post.md",
+                "missing.md",
+            )
+        ]
+        expected = [
+            self.walk_for_bibs(source_path) for source_path in source_paths
+        ]
+
+        index = BibliographyIndex(self.content_dir.name)
+        with mock.patch("os.walk") as walk:
+            found = [index.find(source_path) for source_path in source_paths]
+            walk.assert_not_called()
+
+        self.assertEqual(expected, found)
+        self.assertEqual(5, len(found[0]))
+
+    def test_refresh_picks_up_new_files(self):
+        """Check if the index is rebuilt once a directory changes."""
+        index = BibliographyIndex(self.content_dir.name)
+        source_path = os.path.join(self.content_dir.name, "sub", "other.md")
+        new_bib = os.path.join(
+            self.content_dir.name, "sub", "deeper", "other.json"
+        )
+        with open(new_bib, "w") as file_handle:
+            file_handle.write("")
+        os.utime(os.path.dirname(new_bib), ns=(0, 0))
+
+        self.assertNotIn(new_bib, index.find(source_path))
+        index.refresh()
+        self.assertEqual(
+            self.walk_for_bibs(source_path), index.find(source_path)
+        )
+        self.assertIn(new_bib, index.find(source_path))
+
+
+class TestBibliographyPreparsing(unittest.TestCase):
+    """Test cases for pre-parsing and pruning bibliographies."""
+
+    def setUp(self):
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.content_dir.cleanup)
+        self.addCleanup(remove_bibliography_directory, None)
+        self.source_path = os.path.join(self.content_dir.name, "post.md")
+        with open(self.source_path, "w") as file_handle:
+            file_handle.write(
+                "---\ntitle: Post\n---\n"
+                "A study of DNA [@watson1953, p. 2] and more [@{crick:1953}].\n"
+            )
+        with open(
+            os.path.join(self.content_dir.name, "post.bib"), "w"
+        ) as file_handle:
+            for key, title in (
+                ("watson1953", "{Molecular structure} of {DNA}"),
+                ("crick:1953", "Genetical implications of {DNA}"),
+                ("pauling1953", "A proposed structure for nucleic acids"),
+            ):
+                file_handle.write(
+                    "@article{{{0},\n  author = {{Doe, Jane}},\n"
+                    "  title = {{{1}}},\n  year = {{1953}},\n}}\n".format(
+                        key, title
+                    )
+                )
+
+    def get_settings(self, **kwargs):
+        """Return settings with citations enabled."""
+        return get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS + ["+citations"],
+            PANDOC_ARGS=PANDOC_ARGS + ["--citeproc"],
+            PATH=self.content_dir.name,
+            **kwargs,
+        )
+
+    def test_output_matches_original_bibliography(self):
+        """Check if pre-parsed bibliographies render the same output."""
+        expected = PandocReader(self.get_settings()).read(self.source_path)
+        output = PandocReader(
+            self.get_settings(PANDOC_PREPARSE_BIBLIOGRAPHY=True)
+        ).read(self.source_path)
+
+        self.assertEqual(expected, output)
+        self.assertIn('class="nocase">Molecular structure</span>', output[0])
+        self.assertIn("<span>DNA</span>", output[0])
+
+    def test_nocite_added_to_metadata_file_is_picked_up(self):
+        """Check if nocite added to a metadata file keeps every reference."""
+        metadata_path = os.path.join(self.content_dir.name, "metadata.yaml")
+        with open(metadata_path, "w") as file_handle:
+            file_handle.write("lang: en\n")
+        settings = self.get_settings(PANDOC_PREPARSE_BIBLIOGRAPHY=True)
+        settings["PANDOC_ARGS"] = settings["PANDOC_ARGS"] + [
+            "--metadata-file={}".format(metadata_path)
+        ]
+
+        output, _ = PandocReader(settings).read(self.source_path)
+        self.assertNotIn("ref-pauling1953", output)
+
+        with open(metadata_path, "w") as file_handle:
+            file_handle.write("lang: en\nnocite: '@pauling1953'\n")
+        output, _ = PandocReader(settings).read(self.source_path)
+        self.assertIn("ref-pauling1953", output)
+
+    def test_bibliography_is_pruned_to_cited_keys(self):
+        """Check if only cited references are handed to pandoc."""
+        pandoc_reader = PandocReader(self.get_settings())
+        bib_files = pandoc_reader._find_bibs(self.source_path)
+        with open(self.source_path) as file_handle:
+            content = file_handle.read()
+
+        for document, nocite, expected in (
+            (content, False, ["crick:1953", "watson1953"]),
+            (content + "\nAll of them [@*].\n", False, None),
+            (content, True, None),
+        ):
+            (bibliography,) = pandoc_reader._prepare_bibliographies(
+                bib_files, document, "pandoc", nocite
+            )
+            self.assertTrue(bibliography.endswith(".yaml"))
+            with open(bibliography) as file_handle:
+                references = yaml.safe_load(file_handle)["references"]
+            keys = sorted(reference["id"] for reference in references)
+            self.assertEqual(
+                expected or ["crick:1953", "pauling1953", "watson1953"], keys
+            )
+
+    def test_bibliography_is_parsed_once(self):
+        """Check if pandoc converts every bibliography only once."""
+        settings = self.get_settings(PANDOC_PREPARSE_BIBLIOGRAPHY=True)
+        module = sys.modules[PandocReader.__module__]
+        with mock.patch.dict(module._REFERENCES, clear=True):
+            with mock.patch.object(
+                PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+            ) as run_pandoc:
+                PandocReader(settings).read(self.source_path)
+                PandocReader(settings).read(self.source_path)
+
+        conversions = [
+            call
+            for call in run_pandoc.call_args_list
+            if "--to=markdown-raw_attribute" in call[0][0]
+        ]
+        self.assertEqual(1, len(conversions))
+
+
+class TestBuildManifest(unittest.TestCase):
+    """Test cases for tracking the inputs of every rendered file."""
+
+    def setUp(self):
+        self.addCleanup(stop_prerendering, None)
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.content_dir.cleanup)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.source_paths = []
+        for name in ("first", "second"):
+            source_path = os.path.join(self.content_dir.name, name + ".md")
+            with open(source_path, "w") as file_handle:
+                file_handle.write(
+                    "---\ntitle: {0}\n---\nCited [@{0}].\n".format(name)
+                )
+            with open(
+                os.path.join(self.content_dir.name, name + ".bib"), "w"
+            ) as file_handle:
+                file_handle.write(
+                    "@book{{{0},\n  title = {{{0}}},\n}}\n".format(name)
+                )
+            self.source_paths.append(source_path)
+        self.settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS + ["+citations"],
+            PANDOC_ARGS=PANDOC_ARGS + ["--citeproc"],
+            PATH=self.content_dir.name,
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+
+    def test_changed_bibliography_rerenders_citing_file_only(self):
+        """Check if only files reading a changed bibliography are stale."""
+        first_path, second_path = self.source_paths
+        for source_path in self.source_paths:
+            PandocReader(self.settings).read(source_path)
+            self.assertTrue(
+                PandocReader(self.settings)._is_rendered(source_path)
+            )
+
+        with open(
+            os.path.join(self.content_dir.name, "first.bib"), "a"
+        ) as file_handle:
+            file_handle.write("@book{other,\n  title = {Other},\n}\n")
+
+        self.assertFalse(PandocReader(self.settings)._is_rendered(first_path))
+        self.assertTrue(PandocReader(self.settings)._is_rendered(second_path))
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            PandocReader(self.settings).read(second_path)
+            run_pandoc.assert_not_called()
+            PandocReader(self.settings).read(first_path)
+            run_pandoc.assert_called()
+
+    def test_file_saved_while_rendering_is_stale(self):
+        """Check if a file changed during its rendering is rendered again."""
+        first_path, _ = self.source_paths
+        convert = PandocReader._convert
+
+        def save_and_convert(reader, *args, **kwargs):
+            with open(first_path, "a") as file_handle:
+                file_handle.write("\nNew text.\n")
+            return convert(reader, *args, **kwargs)
+
+        with mock.patch.object(
+            PandocReader,
+            "_convert",
+            autospec=True,
+            side_effect=save_and_convert,
+        ):
+            PandocReader(self.settings).read(first_path)
+
+        self.assertFalse(PandocReader(self.settings)._is_rendered(first_path))
+        output, _ = PandocReader(self.settings).read(first_path)
+        self.assertIn("<p>New text.</p>", output)
+
+    def test_manifest_is_saved_after_build(self):
+        """Check if the manifest is written and read back."""
+        first_path, _ = self.source_paths
+        PandocReader(self.settings).read(first_path)
+        save_build_manifests(None)
+
+        entry = BuildManifest(
+            os.path.join(self.cache_dir.name, "manifest")
+        ).get(first_path)
+        self.assertIsNotNone(entry)
+        self.assertIn(
+            os.path.join(self.content_dir.name, "first.bib"),
+            entry["dependencies"],
+        )
+
+    def test_prerendering_skips_unchanged_files(self):
+        """Check if files rendered from unchanged inputs are not scheduled."""
+        first_path, second_path = self.source_paths
+        PandocReader(self.settings).read(first_path)
+        settings = self.settings.copy()
+        settings["PANDOC_WORKERS"] = 2
+
+        with mock.patch.object(PrerenderPool, "submit") as submit:
+            start_prerendering(mock.Mock(settings=settings))
+        submit.assert_called_once_with(second_path)
+
+
+class TestRenderedDocument(unittest.TestCase):
+    """Test cases for the compact record of a rendering."""
+
+    def test_compressed_output_round_trips(self):
+        """Check if a compressed rendering gives back what it was given."""
+        data = {
+            "output": "<p>Caf\u00e9 " + "text " * 200 + "</p>\n",
+            "toc": "<ul></ul>",
+            "reading_time": 1,
+            "fields": {"summary": "<p>Summary</p>"},
+            "statistics": {"words": 201},
+        }
+        rendered = RenderedDocument.from_dict(data, compress=True)
+
+        self.assertTrue(rendered.compressed)
+        self.assertLess(len(rendered._output), len(data["output"]))
+        self.assertEqual(data, rendered.to_dict())
+        self.assertFalse(hasattr(rendered, "__dict__"))
+
+    def test_field_keys_are_interned(self):
+        """Check if renderings share the strings of their field keys."""
+        key = "".join(["sum", "mary"])
+        rendered = RenderedDocument("<p></p>", fields={key: "<p>1</p>"})
+
+        self.assertIs(sys.intern("summary"), next(iter(rendered.fields)))
+
+    def test_compressed_output_is_read_unchanged(self):
+        """Check if compressing output leaves the read results unchanged."""
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            FORMATTED_FIELDS=FORMATTED_FIELDS,
+        )
+        expected = PandocReader(settings).read(source_path)
+
+        settings["PANDOC_COMPRESS_OUTPUT"] = True
+        self.assertEqual(expected, PandocReader(settings).read(source_path))
+
+
+class TestFieldMemo(unittest.TestCase):
+    """Test cases for converting identical formatted fields only once."""
+
+    def setUp(self):
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.content_dir.cleanup)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.source_paths = []
+        for name in ("first", "second"):
+            source_path = os.path.join(self.content_dir.name, name + ".md")
+            with open(source_path, "w") as file_handle:
+                file_handle.write(
+                    "---\ntitle: {}\nsummary: A *shared* summary.\n---\n"
+                    "Content of {}.\n".format(name.title(), name)
+                )
+            self.source_paths.append(source_path)
+        self.settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            FORMATTED_FIELDS=FORMATTED_FIELDS,
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+            PANDOC_FIELD_MEMO_SIZE=1024,
+        )
+
+    def test_identical_fields_are_converted_once(self):
+        """Check if a value shared by two files is converted only once."""
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            results = [
+                PandocReader(self.settings).read(source_path)
+                for source_path in self.source_paths
+            ]
+        # Both contents and a single summary are converted
+        self.assertEqual(3, run_pandoc.call_count)
+
+        memo = get_field_memo(self.settings)
+        self.assertEqual(1, memo.hits)
+        self.assertEqual(1, memo.misses)
+
+        settings = self.settings.copy()
+        del settings["PANDOC_CACHE_PATH"]
+        del settings["PANDOC_FIELD_MEMO_SIZE"]
+        for source_path, result in zip(self.source_paths, results):
+            self.assertEqual(PandocReader(settings).read(source_path), result)
+
+    def test_memo_is_saved_with_render_cache(self):
+        """Check if the memo is written next to the cache and read back."""
+        PandocReader(self.settings).read(self.source_paths[0])
+        save_field_memos(None)
+
+        memo = FieldMemo(1024, os.path.join(self.cache_dir.name, "fields"))
+        self.assertEqual(1, memo.stats()["entries"])
+
+    def test_least_recently_used_values_are_dropped(self):
+        """Check if the memo stays within its size."""
+        memo = FieldMemo(10)
+        memo.set("first", "<p>1</p>")
+        memo.set("second", "<p>2</p>")
+
+        self.assertIsNone(memo.get("first"))
+        self.assertEqual("<p>2</p>", memo.get("second"))
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "entries": 1, "size": 8}, memo.stats()
+        )
+
+
+class TestWatchCache(unittest.TestCase):
+    """Test cases for keeping renderings in memory between regenerations."""
+
+    def setUp(self):
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.source_path = os.path.join(self.content_dir.name, "post.md")
+        self.bib_path = os.path.join(self.content_dir.name, "post.bib")
+        with open(self.source_path, "w") as file_handle:
+            file_handle.write("---\ntitle: Post\n---\nCited [@post].\n")
+        with open(self.bib_path, "w") as file_handle:
+            file_handle.write("@book{post,\n  title = {Post},\n}\n")
+        self.settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS + ["+citations"],
+            PANDOC_ARGS=PANDOC_ARGS + ["--citeproc"],
+            PATH=self.content_dir.name,
+            PANDOC_WATCH=True,
+        )
+        self.addCleanup(prune_watch_cache, mock.Mock(settings=self.settings))
+        self.addCleanup(self.content_dir.cleanup)
+
+    def read(self):
+        """Read the post and return the result and the pandoc runs made."""
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            result = PandocReader(self.settings).read(self.source_path)
+        return result, run_pandoc.call_count
+
+    def test_unchanged_file_is_not_read_again(self):
+        """Check if an unchanged file is served from memory."""
+        result, _ = self.read()
+        with mock.patch.object(
+            PandocReader, "_read_source"
+        ) as read_source, mock.patch.object(
+            PandocReader, "_run_pandoc"
+        ) as run_pandoc:
+            self.assertEqual(
+                result, PandocReader(self.settings).read(self.source_path)
+            )
+            read_source.assert_not_called()
+            run_pandoc.assert_not_called()
+
+    def test_changed_inputs_are_rendered_again(self):
+        """Check if changes to the file or its bibliography are picked up."""
+        self.read()
+
+        with open(self.source_path, "a") as file_handle:
+            file_handle.write("\nMore content.\n")
+        (output, _), runs = self.read()
+        self.assertNotEqual(0, runs)
+        self.assertIn("<p>More content.</p>", output)
+
+        with open(self.bib_path, "w") as file_handle:
+            file_handle.write("@book{post,\n  title = {Changed},\n}\n")
+        (output, _), runs = self.read()
+        self.assertNotEqual(0, runs)
+        self.assertIn("Changed", output)
+
+        _, runs = self.read()
+        self.assertEqual(0, runs)
+
+    def test_file_saved_while_rendering_is_rendered_again(self):
+        """Check if a file changed during its rendering is not kept stale."""
+        convert = PandocReader._convert
+
+        def save_and_convert(reader, *args, **kwargs):
+            with open(self.source_path, "w") as file_handle:
+                file_handle.write("---\ntitle: Post\n---\nNew text.\n")
+            return convert(reader, *args, **kwargs)
+
+        with mock.patch.object(
+            PandocReader,
+            "_convert",
+            autospec=True,
+            side_effect=save_and_convert,
+        ):
+            (output, _), _ = self.read()
+        self.assertNotIn("New text", output)
+
+        (output, _), runs = self.read()
+        self.assertNotEqual(0, runs)
+        self.assertIn("<p>New text.</p>", output)
+
+    def test_watching_is_disabled_by_default(self):
+        """Check if files are rendered on every read by default."""
+        self.settings["PANDOC_WATCH"] = False
+        self.read()
+        _, runs = self.read()
+        self.assertNotEqual(0, runs)
+
+
+class TestBuildProfile(unittest.TestCase):
+    """Test cases for profiling where the time of a build goes."""
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.profile_path = os.path.join(
+            self.profile_dir.name, "profile", "pandoc.json"
+        )
+
+    def test_profile_records_every_pandoc_run(self):
+        """Check if the profile is logged and written at the end."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            FORMATTED_FIELDS=["summary", "subtitle", "note"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            PANDOC_PROFILE=True,
+            PANDOC_PROFILE_PATH=self.profile_path,
+            PANDOC_PROFILE_TOP=1,
+        )
+        source_paths = [
+            os.path.join(TEST_CONTENT_PATH, filename)
+            for filename in ("formatted_fields_content.md", "valid_content.md")
+        ]
+        for source_path in source_paths:
+            PandocReader(settings).read(source_path)
+
+        with self.assertLogs("pandoc_reader", level="INFO") as logs:
+            report_build_profile(mock.Mock(settings=settings))
+        self.assertIn(
+            "read 2 files with 4 pandoc runs", "\n".join(logs.output)
+        )
+
+        with open(self.profile_path) as file_handle:
+            profile = json.load(file_handle)
+        profiled_file = profile["files"][source_paths[0]]
+        self.assertEqual(
+            ["body+toc", "field:note", "fields:summary,subtitle"],
+            sorted(run["label"] for run in profiled_file["pandoc_runs"]),
+        )
+        self.assertEqual(
+            {
+                "read",
+                "validation",
+                "header",
+                "reading_time",
+                "pandoc",
+                "total",
+            },
+            set(profiled_file["phases"]),
+        )
+        self.assertEqual(1, len(profile["slowest"]))
+        self.assertEqual(4, profile["totals"]["pandoc_runs"])
+
+        # The profile starts over with the next build
+        PandocReader(settings).read(source_paths[1])
+        report_build_profile(mock.Mock(settings=settings))
+        with open(self.profile_path) as file_handle:
+            profile = json.load(file_handle)
+        self.assertEqual([source_paths[1]], list(profile["files"]))
+
+    def test_no_profile_by_default(self):
+        """Check if nothing is profiled unless PANDOC_PROFILE is enabled."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_PROFILE_PATH=self.profile_path,
+        )
+        PandocReader(settings).read(
+            os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        )
+        report_build_profile(mock.Mock(settings=settings))
+
+        self.assertFalse(os.path.exists(self.profile_path))
+
+
+class TestRenderCache(unittest.TestCase):
+    """Test cases for the on-disk render cache."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_cache_hit_skips_pandoc(self):
+        """Check if unchanged files are served without running pandoc."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "valid_content_with_toc.md"
+        )
+
+        uncached_output, uncached_metadata = PandocReader(
+            get_settings(
+                PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+                PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+                CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            )
+        ).read(source_path)
+        first_output, first_metadata = PandocReader(settings).read(source_path)
+
+        with mock.patch.object(PandocReader, "_run_pandoc") as run_pandoc:
+            output, metadata = PandocReader(settings).read(source_path)
+            run_pandoc.assert_not_called()
+
+        self.assertEqual(uncached_output, first_output)
+        self.assertEqual(uncached_output, output)
+        self.assertEqual(uncached_metadata, first_metadata)
+        self.assertEqual(uncached_metadata, metadata)
+
+    def test_changed_settings_miss_cache(self):
+        """Check if different pandoc arguments do not share entries."""
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        PandocReader(
+            get_settings(
+                PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+                PANDOC_ARGS=PANDOC_ARGS,
+                PANDOC_CACHE_PATH=self.cache_dir.name,
+            )
+        ).read(source_path)
+
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--section-divs"],
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", return_value=""
+        ) as run_pandoc:
+            PandocReader(settings).read(source_path)
+            run_pandoc.assert_called()
+
+    def test_changed_filter_misses_cache(self):
+        """Check if files referenced by pandoc options are part of the key."""
+        lua_filter = os.path.join(self.cache_dir.name, "filter.lua")
+        with open(lua_filter, "w") as file_handle:
+            file_handle.write("return {}\n")
+
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--lua-filter", lua_filter],
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        PandocReader(settings).read(source_path)
+
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            PandocReader(settings).read(source_path)
+            run_pandoc.assert_not_called()
+
+            with open(lua_filter, "w") as file_handle:
+                file_handle.write("-- Changed\nreturn {}\n")
+            PandocReader(settings).read(source_path)
+            run_pandoc.assert_called()
+
+    def test_missing_dependency_skips_cache(self):
+        """Check if nothing is cached when a referenced file is missing."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--metadata-file=missing.yaml"],
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", return_value=""
+        ) as run_pandoc:
+            PandocReader(settings).read(source_path)
+            PandocReader(settings).read(source_path)
+            self.assertEqual(2, run_pandoc.call_count)
+        self.assertEqual([], os.listdir(self.cache_dir.name))
+
+    def test_unwritable_cache_does_not_fail_build(self):
+        """Check if errors writing to the cache are only logged."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_CACHE_PATH=self.cache_dir.name,
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with mock.patch(
+            "tempfile.mkstemp", side_effect=OSError("Read-only file system")
+        ):
+            with self.assertLogs("pandoc_reader", level="WARNING"):
+                output, _ = PandocReader(settings).read(source_path)
+        self.assertTrue(output.startswith("<p>This is some valid content"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Check if the cache evicts old entries once it is full."""
+        cache = RenderCache(self.cache_dir.name, max_size=400)
+        for index in range(5):
+            cache.set("key{}".format(index), {"output": "x" * 60})
+            # Make sure modification times differ between entries
+            os.utime(
+                os.path.join(self.cache_dir.name, "key{}.json".format(index)),
+                (index, index),
+            )
+        # Touching the first entry makes it the most recently used one
+        self.assertIsNotNone(cache.get("key0"))
+        cache.set("key5", {"output": "x" * 60})
+
+        self.assertIsNotNone(cache.get("key0"))
+        self.assertIsNone(cache.get("key1"))
+        self.assertIsNotNone(cache.get("key5"))
+        self.assertFalse(
+            [
+                name
+                for name in os.listdir(self.cache_dir.name)
+                if name.endswith(".tmp")
+            ]
+        )
+
+    def test_pruned_bibliographies_are_evicted(self):
+        """Check if pruned bibliographies count towards the cache size."""
+        settings = get_settings(
+            PANDOC_CACHE_PATH=self.cache_dir.name, PANDOC_CACHE_SIZE=360
+        )
+        cache = get_render_cache(settings)
+        cache.set("key", {"output": "x" * 60})
+        os.utime(os.path.join(self.cache_dir.name, "key.json"), (0, 0))
+        first_path = write_bibliography(
+            settings, [{"id": "first", "title": "x" * 120}], csl_json=True
+        )
+        os.utime(first_path, (1, 1))
+
+        # Using a bibliography again makes it the most recently used entry
+        self.assertEqual(
+            first_path,
+            write_bibliography(
+                settings, [{"id": "first", "title": "x" * 120}], csl_json=True
+            ),
+        )
+        second_path = write_bibliography(
+            settings, [{"id": "second", "title": "x" * 120}], csl_json=True
+        )
+
+        self.assertIsNone(cache.get("key"))
+        self.assertTrue(os.path.exists(first_path))
+        self.assertTrue(os.path.exists(second_path))
+        self.assertEqual(
+            os.path.join(self.cache_dir.name, "bibliographies"),
+            os.path.dirname(second_path),
+        )
+
+
+class TestPrerenderPool(unittest.TestCase):
+    """Test cases for rendering files with a pool of workers."""
+
+    def setUp(self):
+        self.addCleanup(stop_prerendering, None)
+
+    @staticmethod
+    def read(settings, source_path):
+        """Read a file and return the result or the exception raised."""
+        try:
+            return PandocReader(settings).read(source_path)
+        except Exception as exception:  # pylint: disable=broad-except
+            return type(exception), str(exception)
+
+    def test_prerendered_results_match_serial_results(self):
+        """Check if results and errors match those of serial reads."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            PATH=TEST_CONTENT_PATH,
+            PANDOC_WORKERS=4,
+        )
+        serial_settings = settings.copy()
+        serial_settings["PANDOC_WORKERS"] = 0
+
+        start_prerendering(mock.Mock(settings=settings))
+        prerender_pool = get_prerender_pool(settings)
+        self.assertIsNotNone(prerender_pool)
+        prerender_pool.wait()
+
+        source_paths = sorted(
+            os.path.join(TEST_CONTENT_PATH, filename)
+            for filename in os.listdir(TEST_CONTENT_PATH)
+            if filename.endswith(".md")
+        )
+        for source_path in source_paths:
+            with mock.patch.object(PandocReader, "_run_pandoc") as run_pandoc:
+                prerendered = self.read(settings, source_path)
+                run_pandoc.assert_not_called()
+            self.assertEqual(
+                self.read(serial_settings, source_path), prerendered
+            )
+
+    def test_compressed_results_match_serial_results(self):
+        """Check if results kept compressed until collected are unchanged."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            PATH=TEST_CONTENT_PATH,
+            PANDOC_WORKERS=2,
+            PANDOC_COMPRESS_OUTPUT=True,
+        )
+        serial_settings = settings.copy()
+        serial_settings["PANDOC_WORKERS"] = 0
+        serial_settings["PANDOC_COMPRESS_OUTPUT"] = False
+
+        start_prerendering(mock.Mock(settings=settings))
+        prerender_pool = get_prerender_pool(settings)
+        prerender_pool.wait()
+
+        for filename in (
+            "valid_content_with_toc.md",
+            "formatted_fields_content.md",
+            "wrong_metadata_end.md",
+        ):
+            source_path = os.path.join(TEST_CONTENT_PATH, filename)
+            if filename != "wrong_metadata_end.md":
+                _, future = prerender_pool._pending[source_path]
+                self.assertTrue(future.result().compressed)
+            self.assertEqual(
+                self.read(serial_settings, source_path),
+                self.read(settings, source_path),
+            )
+
+    def test_content_cache_disables_prerendering(self):
+        """Check if nothing is rendered when Pelican loads cached content."""
+        settings = get_settings(
+            PATH=TEST_CONTENT_PATH,
+            PANDOC_WORKERS=2,
+            LOAD_CONTENT_CACHE=True,
+        )
+        start_prerendering(mock.Mock(settings=settings))
+        self.assertIsNone(get_prerender_pool(settings))
+
+    def test_invalid_workers(self):
+        """Check if an invalid number of workers raises an exception."""
+        for workers in (-1, "4", 2.5):
+            settings = get_settings(
+                PATH=TEST_CONTENT_PATH, PANDOC_WORKERS=workers
+            )
+            with self.assertRaises(ValueError) as context_manager:
+                start_prerendering(mock.Mock(settings=settings))
+
+            message = str(context_manager.exception)
+            self.assertEqual(
+                "PANDOC_WORKERS setting must be a non-negative integer.",
+                message,
+            )
+
+    def test_changed_file_is_rendered_again(self):
+        """Check if a file changed after scheduling is not served stale."""
+        content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(content_dir.cleanup)
+        source_path = os.path.join(content_dir.name, "post.md")
+        with open(source_path, "w") as file_handle:
+            file_handle.write("---\ntitle: Post\n---\nOld content\n")
+
+        settings = get_settings(PATH=content_dir.name, PANDOC_WORKERS=1)
+        start_prerendering(mock.Mock(settings=settings))
+        get_prerender_pool(settings).wait()
+
+        with open(source_path, "w") as file_handle:
+            file_handle.write("---\ntitle: Post\n---\nNew content here\n")
+        os.utime(source_path, ns=(0, 0))
+
+        output, _ = PandocReader(settings).read(source_path)
+        self.assertEqual("<p>New content here</p>\n", output)
+
+
+class TestBatchRendering(unittest.TestCase):
+    """Test cases for rendering files in batches sharing pandoc runs."""
+
+    def setUp(self):
+        self.addCleanup(stop_prerendering, None)
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.content_dir.cleanup)
+
+    def write_file(self, filename, content):
+        """Write a file to the content directory and return its path."""
+        source_path = os.path.join(self.content_dir.name, filename)
+        with open(source_path, "w") as file_handle:
+            file_handle.write(content)
+        return source_path
+
+    def test_batched_results_match_serial_results(self):
+        """Check if files rendered in a batch do not affect each other."""
+        source_paths = [
+            self.write_file(
+                "post-{}.md".format(index),
+                "---\ntitle: Post {0}\nsummary: A summary.^[Note {0}.]\n"
+                "---\n# Introduction\n\nText[^1] with a [link].\n\n"
+                "[^1]: Footnote {0}.\n\n\tIndented\tcode\n".format(index),
+            )
+            for index in range(3)
+        ]
+        # Reference links must not resolve across files
+        source_paths.append(
+            self.write_file(
+                "links.md",
+                "# Introduction\n\n[link]: https://example.com\n",
+            )
+        )
+        source_paths.append(
+            self.write_file("invalid.md", "---\ntitle: [Invalid\n---\n")
+        )
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+            PATH=self.content_dir.name,
+            PANDOC_WORKERS=1,
+            PANDOC_BATCH_SIZE=10,
+        )
+        serial_settings = settings.copy()
+        serial_settings["PANDOC_WORKERS"] = 0
+
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+        ) as run_pandoc:
+            start_prerendering(mock.Mock(settings=settings))
+            get_prerender_pool(settings).wait()
+        # One run for the content, one for the summaries and one repeating
+        # the invalid file on its own to report its error
+        self.assertEqual(3, run_pandoc.call_count)
+
+        for source_path in source_paths:
+            self.assertEqual(
+                TestPrerenderPool.read(serial_settings, source_path),
+                TestPrerenderPool.read(settings, source_path),
+            )
+
+    def test_large_files_are_rendered_alone(self):
+        """Check if batches are closed once their files are too large."""
+        small_paths = [
+            self.write_file("small-{}.md".format(index), "Small file\n")
+            for index in range(3)
+        ]
+        large_path = self.write_file("large.md", "Large file\n" * 100)
+
+        batches = plan_batches(
+            small_paths[:1] + [large_path] + small_paths[1:], 10, 500
+        )
+        self.assertEqual(
+            [small_paths[:1], [large_path], small_paths[1:]], batches
+        )
+        self.assertEqual(
+            [small_paths[:2], small_paths[2:]], plan_batches(small_paths, 2)
+        )
+
+    def test_old_pandoc_renders_files_on_their_own(self):
+        """Check if files are not batched with pandoc older than 2.17."""
+        pandoc_cmd = ["pandoc", "--from", "markdown", "--to", "html5"]
+        self.assertIsNotNone(PandocReader._create_batch_command(pandoc_cmd))
+
+        module = sys.modules[PandocReader.__module__]
+        with mock.patch.object(
+            module, "get_pandoc_version", return_value=(2, 16, 2)
+        ):
+            self.assertIsNone(PandocReader._create_batch_command(pandoc_cmd))
+
+    def test_invalid_batch_size(self):
+        """Check if an invalid batch size raises an exception."""
+        for batch_size in (0, "4", 2.5):
+            settings = get_settings(
+                PATH=self.content_dir.name,
+                PANDOC_WORKERS=1,
+                PANDOC_BATCH_SIZE=batch_size,
+            )
+            with self.assertRaises(ValueError) as context_manager:
+                start_prerendering(mock.Mock(settings=settings))
+
+            message = str(context_manager.exception)
+            self.assertEqual(
+                "PANDOC_BATCH_SIZE setting must be a positive integer.",
+                message,
+            )
+
+
+class TestAsyncReader(unittest.TestCase):
+    """Test cases for reading files from an asyncio event loop."""
+
+    def test_read_async_matches_read(self):
+        """Check if reading asynchronously gives the same results."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            FORMATTED_FIELDS=["summary", "subtitle", "note", "warning"],
+            CALCULATE_READING_TIME=CALCULATE_READING_TIME,
+        )
+        pandoc_reader = PandocReader(settings)
+
+        for filename in (
+            "valid_content_with_toc.md",
+            "formatted_fields_content.md",
+        ):
+            source_path = os.path.join(TEST_CONTENT_PATH, filename)
+            self.assertEqual(
+                pandoc_reader.read(source_path),
+                asyncio.run(pandoc_reader.read_async(source_path)),
+            )
+
+    def test_read_async_bounds_concurrent_processes(self):
+        """Check if conversions run concurrently up to the given limit."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            FORMATTED_FIELDS=["summary", "subtitle", "note", "warning"],
+            PANDOC_ASYNC_PROCESSES=2,
+        )
+        run_pandoc_async = PandocReader._run_pandoc_async
+        running = []
+        most_running = []
+
+        async def count_running(pandoc_cmd, content):
+            running.append(pandoc_cmd)
+            most_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return await run_pandoc_async(pandoc_cmd, content)
+
+        source_path = os.path.join(
+            TEST_CONTENT_PATH, "formatted_fields_content.md"
+        )
+        with mock.patch.object(
+            PandocReader, "_run_pandoc_async", side_effect=count_running
+        ):
+            asyncio.run(PandocReader(settings).read_async(source_path))
+
+        # The content, the batched fields and the two fields converted on
+        # their own are all converted at the same time
+        self.assertEqual(4, len(most_running))
+        self.assertEqual(2, max(most_running))
+
+    def test_invalid_async_processes(self):
+        """Check if exception is raised for an invalid process limit."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_ASYNC_PROCESSES=0,
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with self.assertRaises(ValueError) as context_manager:
+            asyncio.run(PandocReader(settings).read_async(source_path))
+
+        message = str(context_manager.exception)
+        self.assertEqual(
+            "PANDOC_ASYNC_PROCESSES setting must be a positive integer.",
+            message,
+        )
+
+
+class StandInPandocServer(http.server.BaseHTTPRequestHandler):
+    """Minimal stand-in for pandoc-server that runs pandoc itself."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StandInPandocServer.connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Convert the text in the request with pandoc."""
+        params = json.loads(
+            self.rfile.read(int(self.headers["Content-Length"]))
+        )
+        pandoc_cmd = [
+            "pandoc",
+            "--from",
+            params["from"],
+            "--to",
+            params["to"],
+        ]
+        if params.get("html-math-method"):
+            pandoc_cmd.append("--" + params["html-math-method"]["method"])
+        if params.get("table-of-contents"):
+            pandoc_cmd.append("--toc")
+
+        with tempfile.NamedTemporaryFile("w", suffix=".html") as template:
+            if params.get("standalone"):
+                template.write(params["template"])
+                template.flush()
+                pandoc_cmd.extend(
+                    ["--standalone", "--template", template.name]
+                )
+            output = subprocess.run(
+                pandoc_cmd,
+                input=params["text"],
+                capture_output=True,
+                encoding="utf-8",
+                check=True,
+            ).stdout
+
+        # Unlike the command line pandoc-server does not add a final newline
+        if not params.get("standalone"):
+            output = output[:-1]
+        body = json.dumps(
+            {"output": output, "base64": False, "messages": []}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the test output clean."""
+
+
+class TestPandocServerBackend(unittest.TestCase):
+    """Test cases for converting documents with a pandoc server."""
+
+    def setUp(self):
+        StandInPandocServer.connections = 0
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), StandInPandocServer
+        )
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_server_output_matches_subprocess_output(self):
+        """Check if the server backend gives the same results."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--toc"],
+            FORMATTED_FIELDS=["summary", "subtitle", "disclaimer"],
+        )
+        server_settings = settings.copy()
+        server_settings["PANDOC_BACKEND"] = "server"
+        server_settings["PANDOC_SERVER_URL"] = "http://127.0.0.1:{}".format(
+            self.server.server_port
+        )
+
+        for filename in (
+            "valid_content_with_toc.md",
+            "formatted_fields_content.md",
+        ):
+            source_path = os.path.join(TEST_CONTENT_PATH, filename)
+            with mock.patch.object(
+                PandocReader, "_run_pandoc", wraps=PandocReader._run_pandoc
+            ) as run_pandoc:
+                server_result = PandocReader(server_settings).read(source_path)
+                # The field with a footnote is sent on its own, nothing
+                # should have been converted by a pandoc subprocess
+                run_pandoc.assert_not_called()
+
+            self.assertEqual(
+                PandocReader(settings).read(source_path), server_result
+            )
+
+        # All conversions are sent over the same connection
+        self.assertEqual(1, StandInPandocServer.connections)
+
+    def test_unavailable_server_falls_back_to_subprocess(self):
+        """Check if pandoc is run as a subprocess without a server."""
+        with socket.socket() as unused_socket:
+            unused_socket.bind(("127.0.0.1", 0))
+            port = unused_socket.getsockname()[1]
+
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS, PANDOC_ARGS=PANDOC_ARGS
+        )
+        server_settings = settings.copy()
+        server_settings["PANDOC_BACKEND"] = "server"
+        server_settings["PANDOC_SERVER_URL"] = "http://127.0.0.1:{}".format(
+            port
+        )
+
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        self.assertEqual(
+            PandocReader(settings).read(source_path),
+            PandocReader(server_settings).read(source_path),
+        )
+
+    def test_unsupported_options_fall_back_to_subprocess(self):
+        """Check if options the server cannot handle use a subprocess."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS + ["--lua-filter=filter.lua"],
+            PANDOC_BACKEND="server",
+            PANDOC_SERVER_URL="http://127.0.0.1:{}".format(
+                self.server.server_port
+            ),
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with mock.patch.object(
+            PandocReader, "_run_pandoc", return_value=""
+        ) as run_pandoc:
+            PandocReader(settings).read(source_path)
+            run_pandoc.assert_called()
+        self.assertEqual(0, StandInPandocServer.connections)
+
+    def test_metadata_values_keep_colons(self):
+        """Check if metadata and variable values may contain colons."""
+        server = PandocServer("http://127.0.0.1:3030")
+        params = server._create_params(
+            [
+                "pandoc",
+                "-M",
+                "url=http://example.org",
+                "--metadata=lang:en-GB",
+                "-V",
+                "link:http://example.org",
+                "--metadata",
+                "draft",
+            ]
+        )
+        self.assertEqual(
+            {"url": "http://example.org", "lang": "en-GB", "draft": True},
+            params["metadata"],
+        )
+        self.assertEqual({"link": "http://example.org"}, params["variables"])
+
+    def test_invalid_option_values_fall_back_to_subprocess(self):
+        """Check if unreadable files and bad values use a subprocess."""
+        for argument in ("--template=missing.html", "--toc-depth=deep"):
+            settings = get_settings(
+                PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+                PANDOC_ARGS=PANDOC_ARGS + [argument],
+                PANDOC_BACKEND="server",
+                PANDOC_SERVER_URL="http://127.0.0.1:{}".format(
+                    self.server.server_port
+                ),
+            )
+            source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+            with mock.patch.object(
+                PandocReader, "_run_pandoc", return_value=""
+            ) as run_pandoc:
+                PandocReader(settings).read(source_path)
+                run_pandoc.assert_called()
+        self.assertEqual(0, StandInPandocServer.connections)
+
+    def test_invalid_backend(self):
+        """Check if an unknown backend raises an exception."""
+        settings = get_settings(
+            PANDOC_EXTENSIONS=PANDOC_EXTENSIONS,
+            PANDOC_ARGS=PANDOC_ARGS,
+            PANDOC_BACKEND="socket",
+        )
+        source_path = os.path.join(TEST_CONTENT_PATH, "valid_content.md")
+        with self.assertRaises(ValueError) as context_manager:
+            PandocReader(settings).read(source_path)
+
+        message = str(context_manager.exception)
+        self.assertEqual(
+            "PANDOC_BACKEND must be either subprocess or server.", message
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -28,6 +28,30 @@ def tests(c):
     c.run(f"{VENV}/bin/pytest", pty=True)
 
 
+@task
+def benchmark(
+    c,
+    corpus=None,
+    documents=20,
+    paragraphs=20,
+    references=2000,
+    preparse_bibliographies=False,
+    json=None,
+):
+    """Run the reader benchmarks, optionally saving the results as JSON"""
+    corpus_flag = f"--corpus {corpus}" if corpus else ""
+    preparse_flag = (
+        "--preparse-bibliographies" if preparse_bibliographies else ""
+    )
+    json_flag = f"--json {json}" if json else ""
+    c.run(
+        f"{VENV}/bin/python -m benchmarks.reader {corpus_flag}"
+        f" --documents {documents} --paragraphs {paragraphs}"
+        f" --references {references} {preparse_flag} {json_flag}",
+        pty=True,
+    )
+
+
 @task
 def black(c, check=False, diff=False):
     """Run Black auto-formatter, optionally with --check or --diff"""